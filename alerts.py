@@ -0,0 +1,278 @@
+import threading
+import time
+import logging
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Stages meaning the student's file is finished
+CLIENT_STAGES = ['CLIENT', 'CLIENTS']
+
+# Stages in which the DS-160 still has to be done
+DS_160_STAGES = ['PAYMENT & MAIL', 'APPLICATION', 'SCAN & SEND', 'ARAMEX & RDV', 'DS-160']
+
+# Conditions are (operator, column, argument) tuples. Date operators compare the
+# column with today shifted by the argument in days; text operators compare the
+# normalised text (stripped, upper case, no trailing dot), so 'ITW Prep' and
+# 'ITW Prep.' or 'Yes' and 'YES ' are the same value.
+#   'date_after'   column >  today + days
+#   'date_before'  column <  today + days
+#   'date_by'      column <= today + days
+#   'blank'        no value (empty cell, 'nan' or unparseable date)
+#   'in'/'not_in'  normalised text in / not in the given values, normalised the same way
+ALERT_RULES = [
+    {
+        'key': 'school_payment',
+        'tab': "📅 School Payment",
+        'header': "📅 School Payment Due Soon",
+        'description': "These students need to complete their school payment at least 50 days before their school entry date.",
+        'conditions': [('not_in', 'School Paid', ['YES']),
+                       ('date_after', 'School Entry Date', 50),
+                       ('not_in', 'Visa Result', ['VISA DENIED'])],
+        'sort_by': 'DATE',
+        'columns': ['First Name', 'Last Name', 'DATE', 'School Payment Due', 'Stage', 'Agent'],
+    },
+    {
+        'key': 'ds_160',
+        'tab': "📝 DS-160",
+        'header': "📝 DS-160 Step Due Soon",
+        'description': "These students need to complete the DS-160 step within 30 days before their embassy interview date.",
+        'conditions': [('in', 'Stage', DS_160_STAGES),
+                       ('date_after', 'EMBASSY ITW. DATE', 0),
+                       ('date_by', 'EMBASSY ITW. DATE', 30)],
+        'sort_by': 'EMBASSY ITW. DATE',
+        'columns': ['First Name', 'Last Name', 'DATE', 'EMBASSY ITW. DATE', 'Stage', 'Agent'],
+    },
+    {
+        'key': 'interviews',
+        'tab': "🎤 Interviews",
+        'header': "🎤 Upcoming Embassy Interviews (Need Prep)",
+        'description': "These students have embassy interviews scheduled within the next 14 days and they are not prepared yet.",
+        'conditions': [('date_after', 'EMBASSY ITW. DATE', 0),
+                       ('date_by', 'EMBASSY ITW. DATE', 14),
+                       ('not_in', 'Stage', CLIENT_STAGES)],
+        'sort_by': 'EMBASSY ITW. DATE',
+        'columns': ['First Name', 'Last Name', 'DATE', 'EMBASSY ITW. DATE', 'Stage', 'Agent'],
+    },
+    {
+        'key': 'sevis_payment',
+        'tab': "💳 SEVIS Payment",
+        'header': "💳 Need SEVIS Payment",
+        'description': "These students have embassy interviews scheduled within the next 14 days and they did not pay the SEVIS.",
+        'conditions': [('date_after', 'EMBASSY ITW. DATE', 0),
+                       ('date_by', 'EMBASSY ITW. DATE', 14),
+                       ('in', 'Sevis payment ?', ['NO'])],
+        'sort_by': 'EMBASSY ITW. DATE',
+        'columns': ['First Name', 'Last Name', 'DATE', 'EMBASSY ITW. DATE', 'Stage', 'Agent'],
+    },
+    {
+        'key': 'i20',
+        'tab': "📄 I-20 ",
+        'header': "📄 I-20 ",
+        'description': "These students do not have a school entry date recorded one week after the Payment date. They need an I-20 and must mention their entry date in the database.",
+        'conditions': [('date_by', 'DATE', -14),
+                       ('blank', 'School Entry Date', None),
+                       ('not_in', 'Stage', CLIENT_STAGES)],
+        'sort_by': 'DATE',
+        'columns': ['First Name', 'Last Name', 'DATE', 'Stage', 'Agent'],
+    },
+    {
+        'key': 'aramex',
+        'tab': "📆 ARAMEX",
+        'header': "📆 ARAMEX",
+        'description': "These students do not have an embassy interview date recorded two weeks after their initial registration date. They need to schedule their interview and update the database.",
+        'conditions': [('date_by', 'DATE', -14),
+                       ('blank', 'EMBASSY ITW. DATE', None),
+                       ('not_in', 'Stage', CLIENT_STAGES)],
+        'sort_by': 'DATE',
+        'columns': ['First Name', 'Last Name', 'DATE', 'Stage', 'Agent'],
+    },
+    {
+        'key': 'visa_result',
+        'tab': "🔍 Visa Result",
+        'header': "🔍 Visa Result Needed",
+        'description': "These students have passed their embassy interview date and still do not have a recorded visa result. Please update their visa result.",
+        'conditions': [('date_before', 'EMBASSY ITW. DATE', 0),
+                       ('blank', 'Visa Result', None)],
+        'sort_by': 'EMBASSY ITW. DATE',
+        'columns': ['First Name', 'Last Name', 'DATE', 'EMBASSY ITW. DATE', 'Stage', 'Agent'],
+    },
+    {
+        'key': 'unassigned',
+        'tab': "👤 Unassigned Students",
+        'header': "👤 Unassigned Students",
+        'description': "These students are not assigned an agent .",
+        'empty_message': "No unassigned students found. This could mean all students are properly assigned, or there might be an issue with the data or filtering condition.",
+        'conditions': [('blank', 'Agent', None),
+                       ('not_in', 'Stage', CLIENT_STAGES)],
+        'sort_by': 'DATE',
+        'columns': ['First Name', 'Last Name', 'DATE', 'Stage', 'Agent'],
+    },
+]
+
+# Display-only columns derived from the roster before the rules run
+DERIVED_COLUMNS = {
+    'School Payment Due': ('School Entry Date', -50),
+    'DS-160 Due': ('EMBASSY ITW. DATE', -30),
+}
+
+
+# Function to normalise text for comparisons: stripped, upper case, without a trailing dot.
+# Categoricals only normalise their categories, not every row.
+def normalize_text(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = normalize_text(pd.Series(series.cat.categories.astype(str))).to_numpy()
+        codes = series.cat.codes.to_numpy()
+        values = np.where(codes >= 0, categories[codes] if len(categories) else '', '')
+        return pd.Series(values, index=series.index)
+    text = series.fillna('').astype(str).str.strip().str.upper().str.rstrip('.').str.strip()
+    return text.mask(text.isin(['NAN', 'NONE', 'NAT']), '')
+
+
+# Function to add the derived display columns
+def add_derived_columns(data):
+    for name, (source, days) in DERIVED_COLUMNS.items():
+        if source in data.columns:
+            data[name] = data[source] + pd.Timedelta(days=days)
+    return data
+
+
+class RuleEvaluator:
+    """Evaluates alert rules over one roster frame in a single pass.
+
+    Text columns are normalised once and every distinct condition is turned
+    into a boolean mask once, so rules sharing a condition (the 14-day
+    interview window, the client stages) do not rescan the table.
+    """
+
+    def __init__(self, data, today):
+        self.data = data
+        self.today = pd.Timestamp(today)
+        self._text = {}
+        self._masks = {}
+
+    def text(self, col):
+        if col not in self._text:
+            self._text[col] = normalize_text(self.data[col])
+        return self._text[col]
+
+    def is_date(self, col):
+        return pd.api.types.is_datetime64_any_dtype(self.data[col])
+
+    def mask(self, condition):
+        key = (condition[0], condition[1], tuple(condition[2]) if isinstance(condition[2], list) else condition[2])
+        if key not in self._masks:
+            self._masks[key] = self._evaluate(*condition)
+        return self._masks[key]
+
+    def _evaluate(self, op, col, arg):
+        if op in ('date_after', 'date_before', 'date_by'):
+            bound = self.today + pd.Timedelta(days=arg)
+            values = self.data[col]
+            if op == 'date_after':
+                return (values > bound).to_numpy()
+            if op == 'date_before':
+                return (values < bound).to_numpy()
+            return (values <= bound).to_numpy()
+        if op == 'blank':
+            if self.is_date(col):
+                return self.data[col].isna().to_numpy()
+            return (self.text(col) == '').to_numpy()
+        if op in ('in', 'not_in'):
+            # Rule values are normalised like the column, so 'ITW Prep.' in a rule matches too
+            found = self.text(col).isin(normalize_text(pd.Series(arg, dtype=object))).to_numpy()
+            return found if op == 'in' else ~found
+        raise ValueError(f"Unknown alert condition: {op}")
+
+    def matches(self, rule):
+        selected = np.ones(len(self.data), dtype=bool)
+        for condition in rule['conditions']:
+            selected &= self.mask(condition)
+        return selected
+
+
+def has_date_condition(rule):
+    return any(condition[0].startswith('date_') for condition in rule['conditions'])
+
+
+class AlertState:
+    """Materialised alert matches for every roster row, shared by all sessions.
+
+    One boolean mask per rule is kept by row position. When the roster moves
+    to a new version only the rows that changed are re-checked; every rule is
+    re-run over all rows only when the change log cannot tell which rows
+    changed. Date windows are measured from midnight, so the rules with date
+    conditions are swept over all rows once a day.
+    """
+
+    def __init__(self, rules=ALERT_RULES):
+        self.rules = rules
+        self.version = None
+        self.day = None
+        self.timings = {}
+        self.rows_evaluated = 0
+        self._masks = {}
+        self._results = None
+        self._lock = threading.Lock()
+
+    def _is_current(self, version, day):
+        return self._results is not None and self.version == version and self.day == day
+
+    def results(self, store, today=None):
+        # ({rule key: matching rows}, {rule key: seconds}) for the store's current roster
+        day = pd.Timestamp(today if today is not None else datetime.now()).normalize()
+        version, typed = store.typed_snapshot()
+        if self._is_current(version, day):
+            return self._results, self.timings
+        with self._lock:
+            if not self._is_current(version, day):
+                changed = None if self.version is None else store.changed_rows_since(self.version)
+                self._update(typed, day, changed)
+                self._results = self._build_results(typed)
+                self.version, self.day = version, day
+            return self._results, self.timings
+
+    def _update(self, typed, day, changed):
+        size = len(typed)
+        full = changed is None or not self._masks or any(len(mask) > size for mask in self._masks.values())
+        everything = RuleEvaluator(typed, day)
+        if not full:
+            # Appended rows are part of `changed`; start them unmatched
+            for key, mask in self._masks.items():
+                if len(mask) < size:
+                    self._masks[key] = np.concatenate([mask, np.zeros(size - len(mask), dtype=bool)])
+            rows = sorted(p for p in changed if p < size)
+            subset = RuleEvaluator(typed.iloc[rows], day) if rows else None
+
+        timings = {}
+        rows_evaluated = 0
+        for rule in self.rules:
+            started = time.perf_counter()
+            if full or (day != self.day and has_date_condition(rule)):
+                self._masks[rule['key']] = everything.matches(rule)
+                rows_evaluated = size
+            elif subset is not None:
+                self._masks[rule['key']][rows] = subset.matches(rule)
+                rows_evaluated = max(rows_evaluated, len(rows))
+            timings[rule['key']] = time.perf_counter() - started
+        self.timings = timings
+        self.rows_evaluated = rows_evaluated
+        logger.info(f"Alert state updated: {rows_evaluated} of {size} rows re-checked")
+
+    def _build_results(self, typed):
+        results = {}
+        for rule in self.rules:
+            matches = add_derived_columns(typed[self._masks[rule['key']]].copy())
+            results[rule['key']] = matches.sort_values(by=rule['sort_by']).reset_index(drop=True)
+        return results
+
+
+# One alert state per server process
+@st.cache_resource
+def get_alert_state():
+    return AlertState()
@@ -0,0 +1,174 @@
+import re
+import threading
+import logging
+from functools import lru_cache
+import unicodedata
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Blocks larger than this are placeholders ("0000000000", an agency e-mail) or very
+# common names, which say nothing about identity and would chain unrelated students
+MAX_BLOCK_SIZE = 20
+
+# Phone numbers are compared on their last digits, so "+213 555 12 34 56",
+# "00213555123456" and "0555123456" are the same number
+PHONE_DIGITS = 9
+
+_SOUNDEX_CODES = {c: str(d) for d, letters in enumerate(['aeiouyhw', 'bfpv', 'cgjkqsxz', 'dt', 'l', 'mn', 'r']) for c in letters}
+
+
+# Function to normalise phone numbers to their last digits; too short or placeholder numbers become ''
+def normalize_phone(series):
+    digits = series.fillna('').astype(str).str.replace(r'\D', '', regex=True)
+    phones = digits.str[-PHONE_DIGITS:]
+    placeholder = phones.map(lambda phone: len(set(phone)) <= 1)
+    return phones.where((digits.str.len() >= PHONE_DIGITS - 1) & ~placeholder, '')
+
+
+# Function to normalise e-mail addresses; anything without an @ becomes ''
+def normalize_email(series):
+    emails = series.fillna('').astype(str).str.strip().str.lower()
+    return emails.where(emails.str.contains('@', regex=False), '')
+
+
+@lru_cache(maxsize=65536)
+def _soundex(word):
+    word = ''.join(c for c in unicodedata.normalize('NFKD', word.lower()) if 'a' <= c <= 'z')
+    if not word:
+        return ''
+    code = word[0]
+    previous = _SOUNDEX_CODES[word[0]]
+    for c in word[1:]:
+        digit = _SOUNDEX_CODES[c]
+        if digit != previous and digit != '0':
+            code += digit
+        if c not in 'hw':
+            previous = digit
+    return (code + '000')[:4]
+
+
+# Function to build a phonetic key for a full name, independent of word order
+# ("Benali Mohamed" and "Mohammed Benali" share a key)
+def name_key(name):
+    words = [_soundex(word) for word in re.split(r'[\s\-]+', name)]
+    words = sorted(word for word in words if word)
+    return ' '.join(words) if len(words) >= 2 else ''
+
+
+class UnionFind:
+    """Disjoint sets over row positions 0..n-1."""
+
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, i, j):
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i != root_j:
+            self.parent[max(root_i, root_j)] = min(root_i, root_j)
+
+
+def _blocks(keys):
+    # Row positions sharing each non-empty key, skipping singletons and oversized blocks
+    codes, _ = pd.factorize(keys)
+    sizes = np.bincount(codes)[codes]
+    positions = np.flatnonzero((keys != '') & (sizes > 1) & (sizes <= MAX_BLOCK_SIZE))
+    positions = positions[np.argsort(codes[positions], kind='stable')]
+    starts = np.flatnonzero(np.diff(codes[positions], prepend=-1))
+    return np.split(positions, starts[1:])
+
+
+# Function to tell whether two sets of known values (phones or e-mails of a cluster) may
+# belong to one student: they do unless both are known and have nothing in common
+def _compatible(a, b):
+    return not a or not b or not a.isdisjoint(b)
+
+
+# Function to cluster near-duplicate students. Rows are linked when they share a
+# phone number or an e-mail, or when their names sound the same and the phones and
+# e-mails of the rows on both sides do not contradict each other. Returns the cluster id of each row
+# (the position of its first row), aligned with `data`.
+def cluster_ids(data):
+    phones = normalize_phone(data['Phone N°']).to_numpy()
+    emails = normalize_email(data['E-mail']).to_numpy()
+    full_names = data['First Name'].fillna('').astype(str) + ' ' + data['Last Name'].fillna('').astype(str)
+    names = full_names.map({name: name_key(name) for name in full_names.unique()}).to_numpy()
+
+    clusters = UnionFind(len(data))
+    for keys in (phones, emails):
+        for positions in _blocks(keys):
+            for position in positions[1:]:
+                clusters.union(positions[0], position)
+
+    # Namesakes are only merged when nothing tells them apart. The check covers every row
+    # each side is already linked to, so a chain of similar names (one of them with no
+    # phone) cannot join two students with different phone numbers.
+    known = {}
+    for i in range(len(data)):
+        root_phones, root_emails = known.setdefault(clusters.find(i), (set(), set()))
+        if phones[i]:
+            root_phones.add(phones[i])
+        if emails[i]:
+            root_emails.add(emails[i])
+    for positions in _blocks(names):
+        for n, i in enumerate(positions):
+            for j in positions[n + 1:]:
+                root_i, root_j = clusters.find(i), clusters.find(j)
+                if root_i == root_j:
+                    continue
+                (phones_i, emails_i), (phones_j, emails_j) = known[root_i], known[root_j]
+                if _compatible(phones_i, phones_j) and _compatible(emails_i, emails_j):
+                    clusters.union(i, j)
+                    known[clusters.find(i)] = (phones_i | phones_j, emails_i | emails_j)
+
+    return pd.Series([clusters.find(i) for i in range(len(data))], index=data.index)
+
+
+# Function to list every student that has at least one duplicate, grouped by cluster
+def duplicate_groups(data):
+    ids = cluster_ids(data)
+    duplicated = ids.duplicated(keep=False)
+    groups = data[duplicated].assign(**{'Duplicate Group': ids[duplicated]})
+    logger.info(f"Duplicate detection: {len(groups)} rows in {groups['Duplicate Group'].nunique()} groups")
+    return groups.sort_values(by=['Duplicate Group', 'DATE'], kind='stable')
+
+
+# Function to keep one row per student; the last entered row of each cluster is kept
+def deduplicate(data):
+    return data[~cluster_ids(data).duplicated(keep='last')]
+
+
+class DuplicateGroupsCache:
+    """The duplicate groups of the roster's current version, shared by every session."""
+
+    def __init__(self):
+        self.version = None
+        self._groups = None
+        self._lock = threading.Lock()
+
+    def get(self, store):
+        version, typed = store.typed_snapshot()
+        if self._groups is not None and self.version == version:
+            return self._groups
+        with self._lock:
+            if self._groups is None or self.version != version:
+                self._groups = duplicate_groups(typed)
+                self.version = version
+            return self._groups
+
+
+@st.cache_resource
+def get_duplicate_groups_cache():
+    return DuplicateGroupsCache()
@@ -0,0 +1,128 @@
+# Headless alert digests: loads the roster, evaluates the Emergency alert rules and
+# writes one CSV and one HTML digest per agent, once or every day at a fixed time.
+#
+#   GCP_SERVICE_ACCOUNT_FILE=key.json python digest.py --output digests --at 08:30
+#   GCP_SERVICE_ACCOUNT_FILE=key.json python digest.py --once
+import os
+import re
+import html
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta
+import pandas as pd
+from alerts import ALERT_RULES, AlertState, normalize_text
+from roster import ROSTER_SHEET, SPREADSHEET_ID, STUDENT_ID_COLUMN, RosterStore
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTPUT_DIR = 'digests'
+DEFAULT_RUN_AT = '08:00'
+UNASSIGNED_AGENT = 'Unassigned'
+
+# Columns of the per-agent CSV, in order; the alert name comes first
+DIGEST_COLUMNS = [STUDENT_ID_COLUMN] + list(dict.fromkeys(col for rule in ALERT_RULES for col in rule['columns']))
+
+
+def _file_name(agent):
+    return re.sub(r'[^\w\-]+', '_', agent).strip('_') or UNASSIGNED_AGENT
+
+
+def _agent_names(frame):
+    # Agent as written in the sheet, grouped case-insensitively; blanks go to the unassigned digest
+    names = frame['Agent'].astype(str).str.strip()
+    return names.where(normalize_text(frame['Agent']) != '', UNASSIGNED_AGENT)
+
+
+# Function to split the alert results into {agent: [(rule, rows), ...]}
+def digests_by_agent(results, rules=ALERT_RULES):
+    digests = {}
+    for rule in rules:
+        matches = results[rule['key']]
+        if matches.empty:
+            continue
+        agents = _agent_names(matches)
+        for key, rows in matches.groupby(normalize_text(agents).to_numpy(), sort=False):
+            agent = agents.loc[rows.index[0]]
+            digests.setdefault(key, (agent, []))[1].append((rule, rows))
+    return dict(digests.values())
+
+
+def _digest_csv(sections):
+    frames = [rows.assign(Alert=rule['header']) for rule, rows in sections]
+    digest = pd.concat(frames, ignore_index=True)
+    columns = ['Alert'] + [col for col in DIGEST_COLUMNS if col in digest.columns]
+    return digest[columns]
+
+
+def _digest_html(agent, day, sections):
+    parts = [f"<html><head><meta charset='utf-8'><title>{html.escape(agent)} - {day}</title></head><body>",
+             f"<h1>{html.escape(agent)}: alerts for {day}</h1>"]
+    for rule, rows in sections:
+        parts.append(f"<h2>{html.escape(rule['header'])} ({len(rows)})</h2>")
+        parts.append(f"<p>{html.escape(rule['description'])}</p>")
+        parts.append(rows[[STUDENT_ID_COLUMN] + rule['columns']].to_html(index=False, na_rep=''))
+    parts.append("</body></html>")
+    return '\n'.join(parts)
+
+
+# Function to write every agent's digest to output_dir/YYYY-MM-DD/; returns the written paths
+def write_digests(store, state, output_dir, today=None):
+    today = today or datetime.now()
+    # The first call may only load the local snapshot; the second brings it up to date
+    store.get(wait=True)
+    store.get(wait=True)
+    results, timings = state.results(store, today)
+
+    day = today.strftime('%Y-%m-%d')
+    folder = os.path.join(output_dir, day)
+    os.makedirs(folder, exist_ok=True)
+    written = []
+    for agent, sections in digests_by_agent(results).items():
+        base = os.path.join(folder, _file_name(agent))
+        _digest_csv(sections).to_csv(base + '.csv', index=False)
+        with open(base + '.html', 'w', encoding='utf-8') as f:
+            f.write(_digest_html(agent, day, sections))
+        written.extend([base + '.csv', base + '.html'])
+    logger.info(f"Wrote {len(written) // 2} agent digests to {folder} "
+                f"(roster version {state.version}, {sum(timings.values()) * 1000:.1f} ms of rule evaluation)")
+    return written
+
+
+def seconds_until(run_at, now=None):
+    now = now or datetime.now()
+    hour, minute = map(int, run_at.split(':'))
+    next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write per-agent alert digests from the student roster.")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_DIR, help="Folder the dated digest folders are written to")
+    parser.add_argument('--at', default=DEFAULT_RUN_AT, help="Daily run time, HH:MM (local time)")
+    parser.add_argument('--once', action='store_true', help="Write the digests now and exit (for cron)")
+    args = parser.parse_args()
+
+    # One store and alert state for the life of the process, so daily runs only re-check changed rows
+    store = RosterStore(SPREADSHEET_ID, ROSTER_SHEET)
+    state = AlertState()
+    if args.once:
+        write_digests(store, state, args.output)
+        return
+
+    while True:
+        wait = seconds_until(args.at)
+        logger.info(f"Next digest run in {wait / 3600:.1f} h")
+        time.sleep(wait)
+        try:
+            write_digests(store, state, args.output)
+        except Exception as e:
+            logger.error(f"Digest run failed: {str(e)}")
+
+
+if __name__ == '__main__':
+    main()
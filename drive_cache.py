@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import OrderedDict
+import streamlit as st
+
+# Found folders and files rarely disappear, but a "not found" must expire quickly
+# so a folder created elsewhere shows up without waiting minutes
+POSITIVE_TTL_SECONDS = 300
+NEGATIVE_TTL_SECONDS = 15
+MAX_ENTRIES = 2048
+
+
+class DriveMetadataCache:
+    """Thread-safe LRU cache for Drive lookups with separate TTLs for hits and misses.
+
+    Keys are tuples such as ('folder', parent_id, name); a value of None or
+    False is a negative result and expires after `negative_ttl`.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, positive_ttl=POSITIVE_TTL_SECONDS, negative_ttl=NEGATIVE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        # Returns (hit, value)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value):
+        ttl = self.positive_ttl if value else self.negative_ttl
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_prefix(self, prefix):
+        # Drop every key starting with the given tuple, e.g. ('file', folder_id)
+        with self._lock:
+            for key in [key for key in self._entries if key[:len(prefix)] == prefix]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+@st.cache_resource
+def get_drive_cache():
+    return DriveMetadataCache()
@@ -0,0 +1,193 @@
+import threading
+import time
+import logging
+import pandas as pd
+import streamlit as st
+from request_scheduler import BACKGROUND, request_lane
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Drive folder holding one folder per student, each with one folder per document type
+PARENT_FOLDER_ID = '1It91HqQDsYeSo1MuYgACtmkmcO82vzXp'
+
+DOCUMENT_TYPES = ["Passport", "Bank Statement", "Financial Letter",
+                  "Transcripts", "Diplomas", "English Test", "Payment Receipt",
+                  "SEVIS Receipt", "I20"]
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+# How long a built index is served before it is rebuilt
+INDEX_REFRESH_SECONDS = 600
+
+# Folders whose children are listed by one query; keeps the query well under the URL length limit
+PARENTS_PER_QUERY = 50
+
+
+def empty_status():
+    return {doc_type: {'status': False, 'files': []} for doc_type in DOCUMENT_TYPES}
+
+
+# Function to list every file matching a query, following nextPageToken
+def list_all(service, query, fields='id, name, parents'):
+    items = []
+    page_token = None
+    while True:
+        results = service.files().list(
+            q=query,
+            spaces='drive',
+            fields=f'nextPageToken, files({fields})',
+            pageSize=1000,
+            pageToken=page_token
+        ).execute()
+        items.extend(results.get('files', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return items
+
+
+# Function to list the children of many folders matching a query, a few dozen folders per listing
+def list_children(service, parent_ids, query, fields='id, name, parents'):
+    parent_ids = list(parent_ids)
+    items = []
+    for start in range(0, len(parent_ids), PARENTS_PER_QUERY):
+        parents = " or ".join(f"'{parent_id}' in parents" for parent_id in parent_ids[start:start + PARENTS_PER_QUERY])
+        items.extend(list_all(service, f"({parents}) and {query}", fields))
+    return items
+
+
+# Function to build {student name: {document type: {'status', 'files'}}} for the tree under
+# the parent folder. Only that tree is listed, one level at a time (student folders, their
+# document type folders, then the files in those), instead of ten calls per student.
+def build_document_index(service, parent_folder_id=PARENT_FOLDER_ID):
+    # The first student folder wins on duplicate names
+    student_folders = {}
+    for folder in list_all(service, f"'{parent_folder_id}' in parents and mimeType='{FOLDER_MIME_TYPE}' and trashed=false"):
+        student_folders.setdefault(folder['name'], folder['id'])
+    student_by_folder = {folder_id: name for name, folder_id in student_folders.items()}
+
+    type_folders = {}
+    seen = set()
+    for folder in list_children(service, student_by_folder, f"mimeType='{FOLDER_MIME_TYPE}' and trashed=false"):
+        if folder['name'] not in DOCUMENT_TYPES:
+            continue
+        for parent in folder.get('parents', []):
+            student_name = student_by_folder.get(parent)
+            if student_name and (student_name, folder['name']) not in seen:
+                seen.add((student_name, folder['name']))
+                type_folders[folder['id']] = (student_name, folder['name'])
+
+    index = {name: empty_status() for name in student_folders}
+    files = list_children(service, type_folders, f"mimeType!='{FOLDER_MIME_TYPE}' and trashed=false",
+                          'id, name, parents, webViewLink')
+    for file in files:
+        for parent in file.get('parents', []):
+            if parent in type_folders:
+                student_name, doc_type = type_folders[parent]
+                entry = index[student_name][doc_type]
+                entry['files'].append({'id': file['id'], 'name': file['name'], 'webViewLink': file.get('webViewLink')})
+                entry['status'] = True
+
+    logger.info(f"Document index built: {len(index)} student folders, {len(files)} files")
+    return index
+
+
+class DocumentIndex:
+    """Process-wide document status for every student.
+
+    Only the very first build makes a caller wait. Once the index is older
+    than the refresh interval it is still served while a background thread
+    rebuilds it, as the roster store does.
+    """
+
+    def __init__(self, refresh_interval=INDEX_REFRESH_SECONDS):
+        self.refresh_interval = refresh_interval
+        self.built_at = None
+        self._index = None
+        # Students re-read by set_student, and when; a build that started earlier keeps their entry
+        self._updated = {}
+        # One build at a time; held for the Drive listings
+        self._build_lock = threading.Lock()
+        # Guards the index; only held to swap or patch it
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._refresh_flag_lock = threading.Lock()
+
+    def _is_fresh(self):
+        return self._index is not None and time.monotonic() - self.built_at < self.refresh_interval
+
+    def _build(self, service):
+        started = time.monotonic()
+        index = build_document_index(service)
+        with self._lock:
+            for student_name, updated_at in self._updated.items():
+                if updated_at >= started and self._index is not None and student_name in self._index:
+                    index[student_name] = self._index[student_name]
+            self._updated = {}
+            self._index = index
+            self.built_at = started
+
+    def _refresh_in_background(self, service):
+        # Separate lock: callers must not wait behind a build that is already running
+        with self._refresh_flag_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                with request_lane(BACKGROUND), self._build_lock:
+                    if not self._is_fresh():
+                        self._build(service)
+            except Exception as e:
+                logger.error(f"Background document index refresh failed: {str(e)}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, name="document-index-refresh", daemon=True).start()
+
+    def get(self, service, force=False):
+        if not force and self._is_fresh():
+            return self._index
+        # Stale but present: serve it and rebuild without blocking the caller
+        if not force and self._index is not None:
+            self._refresh_in_background(service)
+            return self._index
+        with self._build_lock:
+            if force or self._index is None:
+                self._build(service)
+            return self._index
+
+    def status_for(self, service, student_name):
+        return self.get(service).get(student_name, empty_status())
+
+    def set_student(self, student_name, status):
+        # Replace one student's entry after re-reading just their folder
+        with self._lock:
+            self._updated[student_name] = time.monotonic()
+            if self._index is not None:
+                self._index = {**self._index, student_name: status}
+
+
+@st.cache_resource
+def get_document_index():
+    return DocumentIndex()
+
+
+# Function to list the missing document types of every student in a roster frame
+def missing_documents(service, students):
+    index = get_document_index().get(service)
+    rows = []
+    for name, agent, stage in zip(students['Student Name'], students['Agent'], students['Stage']):
+        status = index.get(name)
+        missing = [doc_type for doc_type in DOCUMENT_TYPES if not (status and status[doc_type]['status'])]
+        if missing:
+            rows.append({
+                'Student Name': name,
+                'Agent': agent,
+                'Stage': stage,
+                'Missing': ", ".join(missing),
+                'Missing Count': len(missing),
+            })
+    return pd.DataFrame(rows, columns=['Student Name', 'Agent', 'Stage', 'Missing', 'Missing Count'])
@@ -0,0 +1,604 @@
+# Local stand-in for the parts of the Sheets v4 and Drive v3 APIs the app uses, so it
+# can be profiled and tested without production access. Latency, per-minute quotas
+# (answered with 429, as Google does) and random server errors can be injected.
+#
+#   python fake_google_api.py --port 8765 --rows 5000 --latency-ms 150 --sheets-read-quota 60
+#   GOOGLE_API_ENDPOINT=http://127.0.0.1:8765 streamlit run main.py
+#
+# State lives in memory and is lost when the server stops. GET /_fake/stats returns
+# request counts per quota bucket and how many requests were throttled or failed.
+import re
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+import itertools
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+import pandas as pd
+import gspread
+from alerts import CLIENT_STAGES, DS_160_STAGES
+from drive_index import DOCUMENT_TYPES, FOLDER_MIME_TYPE, PARENT_FOLDER_ID
+from roster import ROSTER_HEADERS, ROSTER_SHEET, SHEET_DATE_FORMAT, SPREADSHEET_ID
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+
+# Quotas are counted in fixed one-minute windows, like Google's per-minute quotas
+QUOTA_WINDOW_SECONDS = 60
+
+UPLOAD_PATH = '/upload/drive/v3/files'
+
+_A1_RANGE = re.compile(r"^([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?$")
+
+# Drive queries are 'and'-ed clauses of these forms, the only ones the app sends
+_QUERY_CLAUSE = re.compile(r"""\s*(?:
+    (?P<field>name|mimeType)\s*(?P<op>=|!=|contains)\s*'(?P<value>(?:[^'\\]|\\.)*)'
+  | '(?P<parent>(?:[^'\\]|\\.)*)'\s+in\s+parents
+  | \(\s*(?P<any_parent>'(?:[^'\\]|\\.)*'\s+in\s+parents(?:\s+or\s+'(?:[^'\\]|\\.)*'\s+in\s+parents)*)\s*\)
+  | trashed\s*=\s*(?P<trashed>true|false)
+)\s*(?:\band\b|$)""", re.X | re.I)
+
+
+class FakeAPIError(Exception):
+    """An error answered with Google's JSON error body."""
+
+    def __init__(self, code, status, message, headers=None):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+        self.headers = headers or {}
+
+    def body(self):
+        return {'error': {'code': self.code, 'message': str(self), 'status': self.status}}
+
+
+class FaultInjector:
+    """Latency, per-minute quotas and random 503s applied to every request."""
+
+    def __init__(self, latency_ms=0, jitter_ms=0, quotas=None, error_rate=0.0, send_retry_after=False):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.quotas = {bucket: limit for bucket, limit in (quotas or {}).items() if limit}
+        self.error_rate = error_rate
+        self.send_retry_after = send_retry_after
+        self.counts = {}
+        self.throttled = {}
+        self.errors = 0
+        self._window = {}
+        self._lock = threading.Lock()
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+    def check(self, bucket):
+        with self._lock:
+            self.counts[bucket] = self.counts.get(bucket, 0) + 1
+            limit = self.quotas.get(bucket)
+            if limit:
+                now = time.time()
+                start, used = self._window.get(bucket, (now, 0))
+                if now - start >= QUOTA_WINDOW_SECONDS:
+                    start, used = now, 0
+                self._window[bucket] = (start, used + 1)
+                if used >= limit:
+                    self.throttled[bucket] = self.throttled.get(bucket, 0) + 1
+                    wait = max(1, int(start + QUOTA_WINDOW_SECONDS - now + 1))
+                    headers = {'Retry-After': str(wait)} if self.send_retry_after else {}
+                    raise FakeAPIError(429, 'RESOURCE_EXHAUSTED',
+                                       f"Quota exceeded for quota metric '{bucket}' ({limit} per minute)", headers)
+            if self.error_rate and random.random() < self.error_rate:
+                self.errors += 1
+                raise FakeAPIError(503, 'UNAVAILABLE', "The service is currently unavailable.")
+
+    def stats(self):
+        with self._lock:
+            return {'requests': dict(self.counts), 'throttled': dict(self.throttled), 'errors': self.errors}
+
+
+class FakeWorksheet:
+    """A worksheet as a list of rows of strings; row 1 is rows[0]."""
+
+    def __init__(self, sheet_id, title, rows):
+        self.sheet_id = sheet_id
+        self.title = title
+        self.rows = [list(row) for row in rows]
+        # Like a sheet created from data, the grid has no spare column once the data is 26 wide
+        self.column_count = max(max((len(row) for row in self.rows), default=0), 26)
+
+    def properties(self, index):
+        return {'sheetId': self.sheet_id, 'title': self.title, 'index': index, 'sheetType': 'GRID',
+                'gridProperties': {'rowCount': max(len(self.rows), 1000), 'columnCount': self.column_count}}
+
+    def last_row(self):
+        # Number of the last row holding any value
+        for i in range(len(self.rows), 0, -1):
+            if any(self.rows[i - 1]):
+                return i
+        return 0
+
+    def read(self, first_row, first_col, last_row, last_col):
+        # Values of the block, without trailing empty cells and rows, as Google returns them
+        last_row = min(last_row or len(self.rows), len(self.rows))
+        values = []
+        for row in self.rows[first_row - 1:last_row]:
+            cells = row[first_col - 1:last_col] if last_col else row[first_col - 1:]
+            while cells and cells[-1] == '':
+                cells = cells[:-1]
+            values.append(cells)
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def write(self, first_row, first_col, values):
+        width = max((len(row) for row in values), default=0)
+        if first_col - 1 + width > self.column_count:
+            raise FakeAPIError(400, 'INVALID_ARGUMENT',
+                               f"Range exceeds grid limits. Max columns: {self.column_count}")
+        for r, row_values in enumerate(values):
+            row_number = first_row + r
+            while len(self.rows) < row_number:
+                self.rows.append([])
+            row = self.rows[row_number - 1]
+            end = first_col - 1 + len(row_values)
+            if len(row) < end:
+                row.extend([''] * (end - len(row)))
+            row[first_col - 1:end] = ['' if v is None else str(v) for v in row_values]
+
+    def delete_rows(self, start_index, end_index):
+        del self.rows[start_index:end_index]
+
+
+class FakeSpreadsheet:
+    def __init__(self, spreadsheet_id, title):
+        self.spreadsheet_id = spreadsheet_id
+        self.title = title
+        self.worksheets = []
+
+    def add_worksheet(self, title, rows):
+        worksheet = FakeWorksheet(len(self.worksheets), title, rows)
+        self.worksheets.append(worksheet)
+        return worksheet
+
+    def worksheet(self, title=None, sheet_id=None):
+        for worksheet in self.worksheets:
+            if (title is not None and worksheet.title == title) or (sheet_id is not None and worksheet.sheet_id == sheet_id):
+                return worksheet
+        raise FakeAPIError(400, 'INVALID_ARGUMENT', f"Unable to parse range: {title if title is not None else sheet_id}")
+
+    def metadata(self):
+        return {
+            'spreadsheetId': self.spreadsheet_id,
+            'properties': {'title': self.title, 'locale': 'en_US', 'timeZone': 'Africa/Algiers'},
+            'sheets': [{'properties': ws.properties(i)} for i, ws in enumerate(self.worksheets)],
+            'spreadsheetUrl': f"https://docs.google.com/spreadsheets/d/{self.spreadsheet_id}/edit",
+        }
+
+    def resolve(self, range_name):
+        # (worksheet, first row, first col, last row or None, last col or None) for an A1 range
+        sheet_name, _, cells = range_name.rpartition('!')
+        if not sheet_name:
+            unquoted = cells.strip("'").replace("''", "'")
+            if any(ws.title == unquoted for ws in self.worksheets):
+                sheet_name, cells = cells, ''
+        worksheet = self.worksheet(sheet_name.strip("'").replace("''", "'")) if sheet_name else self.worksheets[0]
+        match = _A1_RANGE.match(cells.upper())
+        if not match:
+            raise FakeAPIError(400, 'INVALID_ARGUMENT', f"Unable to parse range: {range_name}")
+        col1, row1, col2, row2 = match.groups()
+        first_col = gspread.utils.a1_to_rowcol(f"{col1}1")[1] if col1 else 1
+        first_row = int(row1) if row1 else 1
+        if match.group(3) is None and match.group(4) is None:
+            # A single cell, or a whole sheet / column / row
+            last_col = first_col if col1 else None
+            last_row = first_row if row1 else None
+        else:
+            last_col = gspread.utils.a1_to_rowcol(f"{col2}1")[1] if col2 else None
+            last_row = int(row2) if row2 else None
+        return worksheet, first_row, first_col, last_row, last_col
+
+    def a1(self, worksheet, first_row, first_col, last_row, last_col):
+        start = gspread.utils.rowcol_to_a1(first_row, first_col)
+        end = gspread.utils.rowcol_to_a1(last_row, last_col)
+        return f"'{worksheet.title}'!{start}:{end}"
+
+
+class FakeDrive:
+    """Drive files and folders kept in memory, with resumable upload sessions."""
+
+    def __init__(self):
+        self.files = {}
+        self.uploads = {}
+        self._ids = itertools.count(1)
+
+    def new_id(self, prefix='fake'):
+        return f"{prefix}{next(self._ids):08d}"
+
+    def add(self, metadata, content=b'', file_id=None):
+        file_id = file_id or self.new_id()
+        self.files[file_id] = {
+            'kind': 'drive#file',
+            'id': file_id,
+            'name': metadata.get('name', 'Untitled'),
+            'mimeType': metadata.get('mimeType', 'application/octet-stream'),
+            'parents': list(metadata.get('parents', [])),
+            'trashed': bool(metadata.get('trashed', False)),
+            'webViewLink': f"https://drive.google.com/file/d/{file_id}/view",
+            'size': str(len(content)),
+        }
+        return self.files[file_id]
+
+    def get(self, file_id):
+        if file_id not in self.files:
+            raise FakeAPIError(404, 'NOT_FOUND', f"File not found: {file_id}.")
+        return self.files[file_id]
+
+    def list(self, query, page_size, page_token):
+        matches = [f for f in self.files.values() if _matches(f, _parse_query(query))]
+        start = int(page_token or 0)
+        page = matches[start:start + page_size]
+        result = {'kind': 'drive#fileList', 'files': page}
+        if start + page_size < len(matches):
+            result['nextPageToken'] = str(start + page_size)
+        return result
+
+
+def _parse_query(query):
+    clauses = []
+    position = 0
+    while position < len(query or ''):
+        match = _QUERY_CLAUSE.match(query, position)
+        if not match or match.end() == position:
+            raise FakeAPIError(400, 'INVALID_ARGUMENT', f"Invalid Value: q={query}")
+        if match.group('field'):
+            value = re.sub(r"\\(.)", r"\1", match.group('value'))
+            clauses.append((match.group('field'), match.group('op').lower(), value))
+        elif match.group('parent') is not None:
+            clauses.append(('parents', 'in', re.sub(r"\\(.)", r"\1", match.group('parent'))))
+        elif match.group('any_parent') is not None:
+            parents = re.findall(r"'((?:[^'\\]|\\.)*)'\s+in\s+parents", match.group('any_parent'))
+            clauses.append(('parents', 'any', {re.sub(r"\\(.)", r"\1", parent) for parent in parents}))
+        else:
+            clauses.append(('trashed', '=', match.group('trashed').lower() == 'true'))
+        position = match.end()
+    return clauses
+
+
+def _matches(file, clauses):
+    for field, op, value in clauses:
+        if field == 'parents':
+            ok = any(parent in value for parent in file['parents']) if op == 'any' else value in file['parents']
+        elif op == 'contains':
+            ok = value.lower() in file[field].lower()
+        else:
+            ok = file[field] == value
+            ok = not ok if op == '!=' else ok
+        if not ok:
+            return False
+    return True
+
+
+# Function to make a plausible roster for benchmarking; `rows` students in the sheet's column order
+def synthetic_roster(rows, seed=0):
+    rng = random.Random(seed)
+    first_names = ['Mohamed', 'Amine', 'Yacine', 'Sara', 'Lina', 'Karim', 'Nour', 'Ines', 'Walid', 'Meriem']
+    last_names = ['Benali', 'Haddad', 'Bouzid', 'Mansouri', 'Cherif', 'Saidi', 'Belkacem', 'Khelifi', 'Amrani', 'Toumi']
+    stages = DS_160_STAGES + ['ITW Prep.', 'SEVIS'] + CLIENT_STAGES
+    schools = ['Auburn University', 'CSU Fullerton', 'Kaplan', 'Lewis University', 'Westcliff University']
+    agents = ['Nesrine', 'Hamza', 'Djazila', 'Meriem', '']
+    started = datetime(2023, 1, 1)
+
+    def date(days_from, spread):
+        return (days_from + timedelta(days=rng.randint(0, spread), minutes=rng.randint(0, 1440))).strftime(SHEET_DATE_FORMAT)
+
+    records = []
+    for _ in range(rows):
+        registered = started + timedelta(days=rng.randint(0, 700))
+        first, last = rng.choice(first_names), rng.choice(last_names)
+        record = {
+            'DATE': date(registered, 0),
+            'First Name': first,
+            'Last Name': last,
+            'Student Name': f"{first} {last}",
+            'Months': registered.strftime('%B %Y'),
+            'Age': str(rng.randint(18, 35)),
+            'Phone N°': f"0{rng.choice('567')}{rng.randint(10000000, 99999999)}",
+            'E-mail': f"{first.lower()}.{last.lower()}{rng.randint(1, 999)}@example.com",
+            'Payment Type': rng.choice(['Cash', 'CCP', 'Baridimob', 'Bank']),
+            'Chosen School': rng.choice(schools),
+            'Payment Amount': rng.choice(['159000', '152000', '139000']),
+            'Sevis payment ?': rng.choice(['YES', 'NO']),
+            'Application payment ?': rng.choice(['YES', 'NO']),
+            'School Entry Date': date(registered, 300) if rng.random() < 0.7 else '',
+            'EMBASSY ITW. DATE': date(registered, 200) if rng.random() < 0.6 else '',
+            'Attempts': rng.choice(['1 st Try', '2 nd Try', '3 rd Try']),
+            'Visa Result': rng.choice(['Visa Approved', 'Visa Denied', '', '']),
+            'Agent': rng.choice(agents),
+            'Stage': rng.choice(stages),
+            'Gender': rng.choice(['Male', 'Female']),
+            'School Paid': rng.choice(['YES', 'NO', '']),
+        }
+        records.append([record.get(col, '') for col in ROSTER_HEADERS])
+    return [ROSTER_HEADERS] + records
+
+
+class FakeGoogleAPI:
+    """State and request handling behind the fake server."""
+
+    def __init__(self, faults=None):
+        self.faults = faults or FaultInjector()
+        self.spreadsheets = {}
+        self.drive = FakeDrive()
+        self._lock = threading.Lock()
+
+    def add_spreadsheet(self, spreadsheet_id, title, worksheets):
+        spreadsheet = FakeSpreadsheet(spreadsheet_id, title)
+        for sheet_title, rows in worksheets.items():
+            spreadsheet.add_worksheet(sheet_title, rows)
+        self.spreadsheets[spreadsheet_id] = spreadsheet
+        # Spreadsheets are Drive files too
+        self.drive.add({'name': title, 'mimeType': 'application/vnd.google-apps.spreadsheet'}, file_id=spreadsheet_id)
+        return spreadsheet
+
+    def seed_drive(self, students, seed=0):
+        # Student folders under the parent folder, each with some document type folders and files
+        rng = random.Random(seed)
+        self.drive.add({'name': 'Students', 'mimeType': FOLDER_MIME_TYPE}, file_id=PARENT_FOLDER_ID)
+        for name in students:
+            student = self.drive.add({'name': name, 'mimeType': FOLDER_MIME_TYPE, 'parents': [PARENT_FOLDER_ID]})
+            for doc_type in rng.sample(DOCUMENT_TYPES, rng.randint(0, len(DOCUMENT_TYPES))):
+                folder = self.drive.add({'name': doc_type, 'mimeType': FOLDER_MIME_TYPE, 'parents': [student['id']]})
+                self.drive.add({'name': f"{doc_type}.pdf", 'mimeType': 'application/pdf', 'parents': [folder['id']]}, b'%PDF')
+
+    def spreadsheet(self, spreadsheet_id):
+        if spreadsheet_id not in self.spreadsheets:
+            raise FakeAPIError(404, 'NOT_FOUND', "Requested entity was not found.")
+        return self.spreadsheets[spreadsheet_id]
+
+    # Function to answer one request; returns (status, body, headers)
+    def handle(self, method, url, headers, body):
+        parts = urlsplit(url)
+        path, query = parts.path, parse_qs(parts.query)
+        if path == '/_fake/stats':
+            return 200, self.faults.stats(), {}
+        bucket = ('drive' if path.startswith(('/drive/', '/upload/')) else
+                  'sheets_read' if method == 'GET' else 'sheets_write')
+        self.faults.delay()
+        self.faults.check(bucket)
+        payload = json.loads(body) if body and headers.get('Content-Type', '').startswith('application/json') else None
+        with self._lock:
+            if path.startswith('/v4/spreadsheets/'):
+                return 200, self._sheets(method, path[len('/v4/spreadsheets/'):], query, payload), {}
+            if path.startswith(UPLOAD_PATH):
+                return self._upload(method, path, query, headers, body)
+            if path.startswith('/drive/v3/files'):
+                return 200, self._drive(method, path[len('/drive/v3/files'):].lstrip('/'), query, payload), {}
+        raise FakeAPIError(404, 'NOT_FOUND', f"No fake endpoint for {method} {path}")
+
+    def _sheets(self, method, rest, query, payload):
+        spreadsheet_id, _, rest = rest.partition('/')
+        spreadsheet_id, _, action = spreadsheet_id.partition(':')
+        spreadsheet = self.spreadsheet(spreadsheet_id)
+        rest = unquote(rest)
+        if not rest and not action and method == 'GET':
+            return spreadsheet.metadata()
+        if action == 'batchUpdate' and method == 'POST':
+            return {'spreadsheetId': spreadsheet_id,
+                    'replies': [self._batch_request(spreadsheet, request) for request in payload.get('requests', [])]}
+        if rest == 'values:batchGet' and method == 'GET':
+            return {'spreadsheetId': spreadsheet_id,
+                    'valueRanges': [self._get_values(spreadsheet, range_name) for range_name in query.get('ranges', [])]}
+        if rest == 'values:batchUpdate' and method == 'POST':
+            responses = [self._update_values(spreadsheet, item['range'], item.get('values', [])) for item in payload.get('data', [])]
+            return {'spreadsheetId': spreadsheet_id, 'totalUpdatedCells': sum(r['updatedCells'] for r in responses),
+                    'responses': responses}
+        if rest.startswith('values/'):
+            range_name = rest[len('values/'):]
+            if range_name.endswith(':append') and method == 'POST':
+                return self._append_values(spreadsheet, range_name[:-len(':append')], payload.get('values', []))
+            if method == 'GET':
+                return self._get_values(spreadsheet, range_name)
+            if method == 'PUT':
+                return self._update_values(spreadsheet, range_name, payload.get('values', []))
+        raise FakeAPIError(404, 'NOT_FOUND', f"No fake Sheets endpoint for {method} {rest or action}")
+
+    def _get_values(self, spreadsheet, range_name):
+        worksheet, first_row, first_col, last_row, last_col = spreadsheet.resolve(range_name)
+        values = worksheet.read(first_row, first_col, last_row, last_col)
+        result = {'range': range_name, 'majorDimension': 'ROWS'}
+        if values:
+            result['values'] = values
+        return result
+
+    def _update_values(self, spreadsheet, range_name, values):
+        worksheet, first_row, first_col, _, _ = spreadsheet.resolve(range_name)
+        worksheet.write(first_row, first_col, values)
+        width = max((len(row) for row in values), default=1)
+        return {'spreadsheetId': spreadsheet.spreadsheet_id,
+                'updatedRange': spreadsheet.a1(worksheet, first_row, first_col, first_row + len(values) - 1, first_col + width - 1),
+                'updatedRows': len(values), 'updatedColumns': width,
+                'updatedCells': sum(len(row) for row in values)}
+
+    def _append_values(self, spreadsheet, range_name, values):
+        # Rows go below the last non-empty row of the sheet, as with INSERT_ROWS
+        worksheet, _, first_col, _, _ = spreadsheet.resolve(range_name)
+        first_row = worksheet.last_row() + 1
+        if len(worksheet.rows) >= first_row:
+            worksheet.rows[first_row - 1:first_row - 1] = [[] for _ in values]
+        updates = self._update_values(spreadsheet, f"'{worksheet.title}'!{gspread.utils.rowcol_to_a1(first_row, first_col)}", values)
+        return {'spreadsheetId': spreadsheet.spreadsheet_id, 'tableRange': f"'{worksheet.title}'!A1", 'updates': updates}
+
+    def _batch_request(self, spreadsheet, request):
+        if 'updateCells' in request:
+            update = request['updateCells']
+            worksheet = spreadsheet.worksheet(sheet_id=update['start']['sheetId'])
+            values = [[_cell_value(cell) for cell in row.get('values', [])] for row in update.get('rows', [])]
+            worksheet.write(update['start']['rowIndex'] + 1, update['start']['columnIndex'] + 1, values)
+            return {}
+        if 'appendCells' in request:
+            append = request['appendCells']
+            worksheet = spreadsheet.worksheet(sheet_id=append['sheetId'])
+            values = [[_cell_value(cell) for cell in row.get('values', [])] for row in append.get('rows', [])]
+            worksheet.write(worksheet.last_row() + 1, 1, values)
+            return {}
+        if 'updateSheetProperties' in request:
+            properties = request['updateSheetProperties']['properties']
+            worksheet = spreadsheet.worksheet(sheet_id=properties['sheetId'])
+            columns = properties.get('gridProperties', {}).get('columnCount')
+            if columns is not None:
+                worksheet.column_count = columns
+            return {}
+        if 'deleteDimension' in request:
+            dimension = request['deleteDimension']['range']
+            if dimension['dimension'] != 'ROWS':
+                raise FakeAPIError(400, 'INVALID_ARGUMENT', "Only row deletion is supported")
+            spreadsheet.worksheet(sheet_id=dimension['sheetId']).delete_rows(dimension['startIndex'], dimension['endIndex'])
+            return {}
+        raise FakeAPIError(400, 'INVALID_ARGUMENT', f"Unsupported batchUpdate request: {', '.join(request)}")
+
+    def _drive(self, method, file_id, query, payload):
+        if not file_id:
+            if method == 'GET':
+                page_size = min(int(query.get('pageSize', ['100'])[0]), 1000)
+                return self.drive.list(query.get('q', [''])[0], page_size, query.get('pageToken', [None])[0])
+            if method == 'POST':
+                return self.drive.add(payload or {})
+        elif method == 'GET':
+            return self.drive.get(file_id)
+        elif method == 'PATCH':
+            file = self.drive.get(file_id)
+            for key in ('name', 'mimeType', 'trashed'):
+                if payload and key in payload:
+                    file[key] = payload[key]
+            for parent in query.get('removeParents', [''])[0].split(','):
+                if parent in file['parents']:
+                    file['parents'].remove(parent)
+            file['parents'].extend(p for p in query.get('addParents', [''])[0].split(',') if p)
+            return file
+        raise FakeAPIError(404, 'NOT_FOUND', f"No fake Drive endpoint for {method} files/{file_id}")
+
+    def _upload(self, method, path, query, headers, body):
+        # Resumable uploads: POST starts a session, each PUT sends a chunk (308 until the last one)
+        if method == 'POST' and query.get('uploadType', [''])[0] == 'resumable':
+            session_id = self.drive.new_id('upload')
+            metadata = json.loads(body) if body else {}
+            metadata.setdefault('mimeType', headers.get('X-Upload-Content-Type', 'application/octet-stream'))
+            self.drive.uploads[session_id] = {'metadata': metadata, 'data': bytearray()}
+            host = headers.get('Host', f"127.0.0.1:{DEFAULT_PORT}")
+            return 200, None, {'Location': f"http://{host}{UPLOAD_PATH}?uploadType=resumable&upload_id={session_id}"}
+        upload = self.drive.uploads.get(query.get('upload_id', [''])[0])
+        if method != 'PUT' or upload is None:
+            raise FakeAPIError(404, 'NOT_FOUND', "Upload session not found")
+        content_range = headers.get('Content-Range', '')
+        match = re.match(r"bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)", content_range)
+        if not match:
+            raise FakeAPIError(400, 'INVALID_ARGUMENT', f"Bad Content-Range: {content_range}")
+        if match.group(1) is not None:
+            start = int(match.group(1))
+            del upload['data'][start:]
+            upload['data'].extend(body or b'')
+        total = match.group(3)
+        if total != '*' and len(upload['data']) >= int(total):
+            del self.drive.uploads[query['upload_id'][0]]
+            return 200, self.drive.add(upload['metadata'], bytes(upload['data'])), {}
+        received = {'Range': f"bytes=0-{len(upload['data']) - 1}"} if upload['data'] else {}
+        return 308, None, received
+
+
+def _cell_value(cell):
+    value = cell.get('userEnteredValue', {})
+    for key in ('stringValue', 'numberValue', 'boolValue', 'formulaValue'):
+        if key in value:
+            return str(value[key]).upper() if key == 'boolValue' else str(value[key])
+    return ''
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    api = None
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        try:
+            status, payload, headers = self.api.handle(self.command, self.path, self.headers, body)
+        except FakeAPIError as e:
+            status, payload, headers = e.code, e.body(), e.headers
+        except Exception as e:
+            logger.exception(f"Fake API failed on {self.command} {self.path}")
+            status, payload, headers = 500, FakeAPIError(500, 'INTERNAL', str(e)).body(), {}
+        data = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if data:
+            self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_PATCH = _handle
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+# Function to start the fake server on a background thread; returns the server (call shutdown() to stop)
+def serve(api, host='127.0.0.1', port=DEFAULT_PORT):
+    handler = type('Handler', (FakeAPIHandler,), {'api': api})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-google-api", daemon=True).start()
+    logger.info(f"Fake Google API listening on http://{host}:{server.server_port}")
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local fake of the Sheets and Drive APIs used by the app.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--rows', type=int, default=1000, help="Synthetic students in the roster sheet")
+    parser.add_argument('--roster-csv', help="Load the roster sheet from a CSV export instead")
+    parser.add_argument('--drive-students', type=int, default=100, help="Students given Drive folders")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency-ms', type=float, default=0, help="Added to every request")
+    parser.add_argument('--jitter-ms', type=float, default=0, help="Random extra latency, up to this much")
+    parser.add_argument('--sheets-read-quota', type=int, default=0, help="Sheets reads per minute (0: unlimited)")
+    parser.add_argument('--sheets-write-quota', type=int, default=0, help="Sheets writes per minute (0: unlimited)")
+    parser.add_argument('--drive-quota', type=int, default=0, help="Drive requests per minute (0: unlimited)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument('--retry-after', action='store_true', help="Send Retry-After with 429 answers")
+    args = parser.parse_args()
+
+    faults = FaultInjector(args.latency_ms, args.jitter_ms,
+                           {'sheets_read': args.sheets_read_quota, 'sheets_write': args.sheets_write_quota,
+                            'drive': args.drive_quota},
+                           args.error_rate, args.retry_after)
+    api = FakeGoogleAPI(faults)
+    if args.roster_csv:
+        frame = pd.read_csv(args.roster_csv, dtype=str, keep_default_na=False)
+        rows = [list(frame.columns)] + frame.values.tolist()
+    else:
+        rows = synthetic_roster(args.rows, args.seed)
+    api.add_spreadsheet(SPREADSHEET_ID, 'Students', {ROSTER_SHEET: rows})
+    header = rows[0]
+    names = {row[header.index('Student Name')] for row in rows[1:] if row[header.index('Student Name')]}
+    api.seed_drive(sorted(names)[:args.drive_students], args.seed)
+    logger.info(f"Roster sheet: {len(rows) - 1} rows; Drive: {len(api.drive.files)} files")
+
+    server = serve(api, args.host, args.port)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
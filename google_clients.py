@@ -0,0 +1,179 @@
+import os
+import json
+import queue
+import threading
+import logging
+from datetime import datetime, timedelta
+import gspread
+import httplib2
+import streamlit as st
+from google.auth.credentials import AnonymousCredentials
+from google.auth.transport.requests import AuthorizedSession, Request
+from google.oauth2.service_account import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+from requests.adapters import HTTPAdapter
+from request_scheduler import get_request_scheduler
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Define the scopes
+SCOPES = ['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/auth/spreadsheets']
+
+HTTP_TIMEOUT_SECONDS = 30
+
+# Idle keep-alive connections kept per API
+POOL_SIZE = 10
+
+# Tokens are refreshed this long before they expire, so no request waits on an OAuth exchange
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+_token_lock = threading.Lock()
+
+
+# Jobs running outside Streamlit (digest.py) can point this at a service account key file
+SERVICE_ACCOUNT_FILE_ENV = 'GCP_SERVICE_ACCOUNT_FILE'
+
+
+# Set to the address of a local fake API server (fake_google_api.py) to run without Google access;
+# requests to the Sheets and Drive hosts are then sent there, unauthenticated
+API_ENDPOINT_ENV = 'GOOGLE_API_ENDPOINT'
+
+GOOGLE_API_HOSTS = ['https://sheets.googleapis.com', 'https://www.googleapis.com']
+
+
+def api_endpoint():
+    return os.environ.get(API_ENDPOINT_ENV, '').rstrip('/') or None
+
+
+# Function to send a Google API URL to the configured endpoint, if any
+def route_url(url):
+    endpoint = api_endpoint()
+    if endpoint:
+        for host in GOOGLE_API_HOSTS:
+            if url.startswith(host):
+                return endpoint + url[len(host):]
+    return url
+
+
+def service_account_info():
+    path = os.environ.get(SERVICE_ACCOUNT_FILE_ENV)
+    if path:
+        with open(path) as f:
+            return json.load(f)
+    return st.secrets["gcp_service_account"]
+
+
+# One set of service account credentials per process
+@st.cache_resource
+def get_credentials():
+    if api_endpoint():
+        return AnonymousCredentials()
+    return Credentials.from_service_account_info(service_account_info(), scopes=SCOPES)
+
+
+def _token_expiring(creds):
+    if isinstance(creds, AnonymousCredentials):
+        return False
+    return not creds.valid or creds.expiry is None or creds.expiry - datetime.utcnow() < TOKEN_REFRESH_MARGIN
+
+
+# Function to refresh the access token ahead of its expiry; only one thread refreshes
+def ensure_fresh_token(creds=None):
+    creds = creds or get_credentials()
+    if _token_expiring(creds):
+        with _token_lock:
+            if _token_expiring(creds):
+                creds.refresh(Request())
+                logger.info("Google access token refreshed")
+    return creds
+
+
+class PooledHttp:
+    """Thread-safe stand-in for httplib2.Http.
+
+    httplib2 connections cannot be shared between threads, so each request
+    borrows an idle authorized connection from the pool (or opens one) and
+    returns it afterwards, keeping the TLS session alive for the next caller.
+    """
+
+    def __init__(self, creds, pool_size=POOL_SIZE, timeout=HTTP_TIMEOUT_SECONDS):
+        self.credentials = creds
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+
+    def request(self, uri, *args, **kwargs):
+        uri = route_url(uri)
+        return get_request_scheduler().execute('drive', lambda: self._send(uri, *args, **kwargs), _httplib2_status)
+
+    def _send(self, *args, **kwargs):
+        ensure_fresh_token(self.credentials)
+        try:
+            http = self._idle.get_nowait()
+        except queue.Empty:
+            connection = httplib2.Http(timeout=self.timeout)
+            # Resumable uploads answer 308 without a Location; build() only turns this off on plain Http objects
+            connection.redirect_codes = connection.redirect_codes - {308}
+            http = AuthorizedHttp(self.credentials, http=connection)
+        try:
+            return http.request(*args, **kwargs)
+        finally:
+            try:
+                self._idle.put_nowait(http)
+            except queue.Full:
+                pass
+
+
+def _httplib2_status(response):
+    headers, _ = response
+    return headers.status, headers.get('retry-after')
+
+
+def _requests_status(response):
+    return response.status_code, response.headers.get('Retry-After')
+
+
+class ScheduledSession(AuthorizedSession):
+    """AuthorizedSession whose requests go through the request scheduler."""
+
+    def request(self, method, url, *args, **kwargs):
+        url = route_url(url)
+        if '/drive/' in url:
+            bucket = 'drive'
+        else:
+            bucket = 'sheets_read' if method.upper() == 'GET' else 'sheets_write'
+        send = lambda: super(ScheduledSession, self).request(method, url, *args, **kwargs)
+        return get_request_scheduler().execute(bucket, send, _requests_status)
+
+
+# One pooled HTTP session for gspread
+@st.cache_resource
+def get_authorized_session():
+    session = ScheduledSession(get_credentials())
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount('https://', adapter)
+    return session
+
+
+@st.cache_resource
+def _build_sheet_client():
+    return gspread.Client(auth=get_credentials(), session=get_authorized_session())
+
+
+@st.cache_resource
+def _build_drive_service():
+    return build('drive', 'v3', http=PooledHttp(get_credentials()), cache_discovery=False)
+
+
+# Authenticated gspread client shared by every page and session
+def get_google_sheet_client():
+    ensure_fresh_token()
+    return _build_sheet_client()
+
+
+# Drive service shared by every page, session and worker thread
+def get_google_drive_service():
+    ensure_fresh_token()
+    return _build_drive_service()
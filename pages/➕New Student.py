@@ -1,66 +1,24 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
-from google.oauth2.service_account import Credentials
-import gspread
-import time
+from roster import load_roster
+from write_queue import get_write_queue, show_sync_status
 
-# Use Streamlit secrets for service account info
-SERVICE_ACCOUNT_INFO = st.secrets["gcp_service_account"]
-
-# Define the scopes
-SCOPES = ['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/auth/spreadsheets']
-
-# Authenticate and build the Google Sheets service
-@st.cache_resource
-def get_google_sheet_client():
-    creds = Credentials.from_service_account_info(SERVICE_ACCOUNT_INFO, scopes=SCOPES)
-    return gspread.authorize(creds)
-
-# Function to add a new student to the Google Sheet
+# Function to add a new student to the Google Sheet. The row is queued and appended
+# in the background in a single call; returns the new student's ID.
 def add_student_to_sheet(student_data):
-    client = get_google_sheet_client()
-    sheet = client.open_by_key("1os1G3ri4xMmJdQSNsVSNx6VJttyM8JsPNbmH0DCFUiI").worksheet('ALL')
-
     # Concatenate First Name and Last Name for Student Name
     student_data["Student Name"] = f"{student_data['First Name']} {student_data['Last Name']}"
 
-    # Add student data to a new row
-    sheet.append_row(list(student_data.values()))
-
-    # Add the month in '%B %Y' format to the 'Months' column
-    date_str = student_data['DATE']
-    date_obj = datetime.strptime(date_str, "%d/%m/%Y %H:%M:%S")
-    month_year = date_obj.strftime("%B %Y")
-
-    # Find the last row where the student was added
-    last_row = len(sheet.get_all_values())
-
-    # Ensure 'Months' column exists; if not, add it as a header in the first row
-    try:
-        months_col_index = sheet.row_values(1).index('Months') + 1
-    except ValueError:
-        # If 'Months' column header doesn't exist, add it at the end of the headers
-        sheet.update_cell(1, len(sheet.row_values(1)) + 1, 'Months')
-        months_col_index = len(sheet.row_values(1))  # New index for 'Months' column
+    # The month in '%B %Y' format goes in the 'Months' column of the same row
+    date_obj = datetime.strptime(student_data['DATE'], "%d/%m/%Y %H:%M:%S")
+    student_data["Months"] = date_obj.strftime("%B %Y")
 
-    # Update the 'Months' column with the month-year value in the row where the student was added
-    sheet.update_cell(last_row, months_col_index, month_year)
+    return get_write_queue().append_row(student_data)
 
-# Function to load data from Google Sheets
-@st.cache_data(ttl=5)
+# Function to load data from the shared roster
 def load_data():
     try:
-        client = get_google_sheet_client()
-        sheet = client.open_by_key("1os1G3ri4xMmJdQSNsVSNx6VJttyM8JsPNbmH0DCFUiI").worksheet('ALL')
-        expected_headers = ["DATE", "First Name", "Last Name", "Age", "Gender", "Phone N°", "Address", "E-mail", 
-                            "Emergency contact N°", "Chosen School", "Specialite", "Duration", "Payment Amount", 
-                            "Payment Type", "Compte", "Sevis payment ?", "Application payment ?", "DS-160 maker", 
-                            "Password DS-160", "Secret Q.", "School Entry Date", "Entry Date in the US", 
-                            "ADDRESS in the U.S", "E-MAIL RDV", "PASSWORD RDV", "EMBASSY ITW. DATE", "Attempts", 
-                            "Visa Result", "Agent", "Note", "Stage", "BANK", "Student Name"]
-        data = sheet.get_all_records(expected_headers=expected_headers)
-        return pd.DataFrame(data)
+        return load_roster()
     except Exception as e:
         st.error(f"Error loading data from Google Sheet: {e}")
         raise e
@@ -119,6 +77,7 @@ def main():
     load_css()
 
     st.title("🎓 Add New Student")
+    show_sync_status()
     st.markdown("Fill in the form below to add a new student to the database.")
 
     # Initialize session state
@@ -203,9 +162,8 @@ def main():
                 
             }
 
-            # Add student to sheet
+            # Add student to sheet; the shared roster picks up the new row once it is written
             add_student_to_sheet(student_data)
-            time.sleep(1)  # Simulate processing time
 
         # Set success message
         st.session_state.success_message = f"✅ Student {first_name} {last_name} added successfully!"
@@ -1,22 +1,21 @@
-import os
 import json
-import gspread
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from datetime import datetime
+from googleapiclient.http import MediaIoBaseUpload
 import plotly.express as px
-import functools
 import logging
 import asyncio
-import aiohttp
 import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
-import string
-import time
 import re
+from google_clients import get_google_drive_service
+from roster import STUDENT_ID_COLUMN, load_students, get_roster_store, get_roster_version, diff_record, refresh_student
+from roster_refresher import watch_roster
+from write_queue import get_write_queue, show_sync_status
+from drive_cache import get_drive_cache
+from drive_index import DOCUMENT_TYPES, PARENT_FOLDER_ID, empty_status, get_document_index, missing_documents
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -26,204 +25,133 @@ def on_student_select():
     st.session_state.student_changed = True
 
 def reload_data(spreadsheet_id):
-    data = load_data(spreadsheet_id)
+    data = load_data(spreadsheet_id, force=True)
     st.session_state['data'] = data
     return data
 
-# Caching decorator
-def cache_with_timeout(timeout_minutes=60):
-    def decorator(func):
-        cache = {}
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            key = str(args) + str(kwargs)
-            if key in cache:
-                result, timestamp = cache[key]
-                if datetime.now() - timestamp < timedelta(minutes=timeout_minutes):
-                    return result
-            result = func(*args, **kwargs)
-            cache[key] = (result, datetime.now())
-            return result
-        return wrapper
-    return decorator
-
-# Use Streamlit secrets for service account info
-SERVICE_ACCOUNT_INFO = st.secrets["gcp_service_account"]
-
-# Define the scopes
-SCOPES = ['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/auth/spreadsheets']
-
-# Authenticate and build the Google Drive service
-@st.cache_resource
-@cache_with_timeout(timeout_minutes=60)
-def get_google_drive_service():
-    creds = Credentials.from_service_account_info(SERVICE_ACCOUNT_INFO, scopes=SCOPES)
-    return build('drive', 'v3', credentials=creds)
+# Uploads are sent in resumable chunks, so a dropped connection only resends the current chunk
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # must be a multiple of 256 KB
 
-# Authenticate and build the Google Sheets service
-@st.cache_resource
-@cache_with_timeout(timeout_minutes=60)
-def get_google_sheet_client():
-    creds = Credentials.from_service_account_info(SERVICE_ACCOUNT_INFO, scopes=SCOPES)
-    return gspread.authorize(creds)
-
-# Function to upload a file to Google Drive
-@cache_with_timeout(timeout_minutes=5)
-def upload_file_to_drive(file_path, mime_type, folder_id=None):
+# Function to upload a file-like object to Google Drive, streaming it from memory.
+# `progress` is called with the fraction uploaded after each chunk.
+def upload_file_to_drive(file_obj, file_name, mime_type, folder_id=None, progress=None):
     service = get_google_drive_service()
-    file_metadata = {'name': os.path.basename(file_path)}
+    file_metadata = {'name': file_name}
     if folder_id:
         file_metadata['parents'] = [folder_id]
     
-    media = MediaFileUpload(file_path, mimetype=mime_type)
-    file = service.files().create(
+    file_obj.seek(0)
+    media = MediaIoBaseUpload(file_obj, mimetype=mime_type, chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+    request = service.files().create(
         body=file_metadata,
         media_body=media,
-        fields='id').execute()
-    file_id = file.get('id')
-    if file_id:
-        st.session_state.upload_success = True
-        return file_id
-    return None
-
-
-import time
-from googleapiclient.errors import HttpError
+        fields='id')
+    file = None
+    while file is None:
+        status, file = request.next_chunk(num_retries=3)
+        if status and progress:
+            progress(status.progress())
+    if progress:
+        progress(1.0)
+    return file.get('id')
+
+
+def load_data(spreadsheet_id, force=False):
+    try:
+        # The roster is shared by every page and session in the process
+        combined_data = load_students(force=force)
 
-def retry_request(func, retries=3, delay=2):
-    for i in range(retries):
-        try:
-            return func()
-        except (HttpError, Exception) as e:
-            logger.error(f"Error occurred: {str(e)}. Retrying...")
-            if i < retries - 1:
-                time.sleep(delay * (2 ** i))
-                continue
-            else:
-                logger.error(f"Maximum retries reached. Error: {str(e)}")
-                raise e
-
-def load_data(spreadsheet_id):
-    sheet_headers = {
-        'ALL': [
-            'DATE', 'First Name', 'Last Name', 'Age', 'Phone N°', 'Address', 'E-mail', 'Payment Type', 'Compte', 'Student Name', 'Months',
-            'Emergency contact N°', 'Chosen School', 'Specialite', 'Duration',
-            'Payment Amount', 'Sevis payment ?', 'Application payment ?', 'DS-160 maker',
-            'Password DS-160', 'Secret Q.', 'School Entry Date', 'Entry Date in the US',
-            'ADDRESS in the U.S', 'E-MAIL RDV', 'PASSWORD RDV', 'EMBASSY ITW. DATE',
-            'Attempts', 'Visa Result', 'Agent', 'Note', 'Stage', 'Gender', 'BANK', 'Prep ITW', 'School Paid'
-        ]
-    }
+        if not combined_data.empty:
+            # Create Student Name column
+            combined_data['Student Name'] = combined_data['First Name'] + " " + combined_data['Last Name']
+            combined_data.dropna(how='all', inplace=True)
 
-    try:
-        client = get_google_sheet_client()
-        sheet = client.open_by_key(spreadsheet_id)
-        
-        combined_data = pd.DataFrame()
-        
-        for worksheet in sheet.worksheets():
-            title = worksheet.title
-            expected_headers = sheet_headers.get(title, None)
-            
-            if expected_headers:
-                data = worksheet.get_all_records(expected_headers=expected_headers, value_render_option='FORMATTED_VALUE')
-            else:
-                data = worksheet.get_all_records(value_render_option='FORMATTED_VALUE')
-            
-            df = pd.DataFrame(data)
-            if not df.empty:
-                # Ensure phone numbers and other text fields are treated as strings
-                text_columns = ['First Name', 'Last Name', 'Phone N°', 'Emergency contact N°', 'E-mail', 'Address']
-                for col in text_columns:
-                    if col in df.columns:
-                        df[col] = df[col].astype(str)
-                
-                # Create Student Name column
-                if 'First Name' in df.columns and 'Last Name' in df.columns:
-                    df['Student Name'] = df['First Name'] + " " + df['Last Name']
-                
-                df.dropna(subset=['Student Name'], inplace=True)
-                df.dropna(how='all', inplace=True)
-                combined_data = pd.concat([combined_data, df], ignore_index=True)
-        
-        # Handle duplicates by appending a number to duplicate names
-        combined_data['Student Name'] = combined_data['Student Name'].astype(str)
-        name_counts = combined_data['Student Name'].value_counts()
-        for name, count in name_counts.items():
-            if count > 1:
-                indices = combined_data[combined_data['Student Name'] == name].index
-                for i, idx in enumerate(indices):
-                    combined_data.at[idx, 'Student Name'] = f"{name} {i+1}"
-        
-        combined_data.reset_index(drop=True, inplace=True)
+        # Rows are looked up by their stable Student ID, which also tells apart students sharing a name
+        combined_data.index = combined_data[STUDENT_ID_COLUMN].values
 
         return combined_data
     except Exception as e:
         st.error(f"An error occurred: {str(e)}")
         return pd.DataFrame()
 
-def save_data(df, spreadsheet_id, sheet_name, student_name):
+# Function to label students in the search box; shared names get the phone number appended
+def student_labels(df):
+    names = df['Student Name']
+    labels = names.where(~names.duplicated(keep=False), names + " (" + df['Phone N°'] + ")")
+    return labels.to_dict()
+
+# Function to save changed cells. `base` is the record the edit started from and `fingerprint`
+# the row's fingerprint at that time; returns (saved, conflicts), where conflicts are the
+# fields someone else changed in the meantime, which are left as they are.
+def save_data(student_id, changes, student_name, base=None, fingerprint=None):
     logger.info("Attempting to save changes for the specific student")
 
     try:
-        client = get_google_sheet_client()
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        sheet = spreadsheet.worksheet(sheet_name)
-
-        # Locate the specific row to update based on the student's name
-        student_row_index = df.index[df['Student Name'] == student_name].tolist()
-        
-        if not student_row_index:
-            logger.error(f"Student '{student_name}' not found in the data.")
-            return False
-
-        # Assuming row indices in Google Sheets start from 1 and there's a header row, adjust by +2
-        google_sheet_row_index = student_row_index[0] + 2
-
-        # Prepare the data for the specific row to be updated
-        student_data = df.loc[student_row_index[0]].copy()
-
-        # Convert date columns to the specific string format 'dd/mm/yyyy HH:MM:SS'
-        date_columns = ['DATE', 'School Entry Date', 'Entry Date in the US', 'EMBASSY ITW. DATE']
-        for col in date_columns:
-            if col in student_data.index and pd.notnull(student_data[col]):
-                # Convert to datetime object if it's not already
-                if not isinstance(student_data[col], (datetime, pd.Timestamp)):
-                    student_data[col] = pd.to_datetime(student_data[col], errors='coerce', dayfirst=True)
-                
-                # Convert datetime to string in the desired format
-                if pd.notnull(student_data[col]):  # Check again in case conversion failed
-                    student_data[col] = student_data[col].strftime('%d/%m/%Y %H:%M:%S')
-                else:
-                    student_data[col] = ""  # Handle NaT values as empty strings
-
-        # Convert the row data to a list
-        student_data_list = student_data.tolist()
-
-        # Number of columns in the Google Sheet
-        num_cols = len(df.columns)
-
-        # Function to get Excel-style column name (e.g., 'A', 'AA')
-        def get_column_letter(col_idx):
-            letters = string.ascii_uppercase
-            result = []
-            while col_idx:
-                col_idx, rem = divmod(col_idx - 1, 26)
-                result[:0] = letters[rem]
-            return ''.join(result)
-
-        # Calculate the range for the specific row (e.g., 'A2:Z2')
-        end_col_letter = get_column_letter(num_cols)
-        range_to_update = f'A{google_sheet_row_index}:{end_col_letter}{google_sheet_row_index}'
-
-        # Update only the specific row
-        sheet.update(range_to_update, [student_data_list], value_input_option='USER_ENTERED')
-
-        logger.info(f"Changes saved successfully for student: {student_name}")
-        return True
+        # Applied to the shared roster now; only the changed cells are sent to the sheet in the background
+        conflicts = get_write_queue().update_cells(student_id, changes, base, fingerprint)
+        logger.info(f"Changes queued for student: {student_name} ({len(changes) - len(conflicts)} cells, "
+                    f"{len(conflicts)} conflicts)")
+        return True, conflicts
     except Exception as e:
         logger.error(f"Error saving changes for student {student_name}: {str(e)}")
-        return False
+        return False, {}
+
+# Function to explain edits that were not saved because someone else changed the same fields
+def show_conflicts(conflicts):
+    lines = [f"- **{col}**: now '{theirs}', yours '{ours}'" for col, (theirs, ours) in conflicts.items()]
+    st.warning("Someone else changed these fields while you were editing, so your values were not saved "
+               "(your other changes were). Save again to overwrite them:\n" + "\n".join(lines))
+
+# Edit form widgets: sheet column -> widget key
+EDIT_WIDGETS = {
+    'First Name': 'first_name',
+    'Last Name': 'last_name',
+    'Phone N°': 'phone_number',
+    'E-mail': 'email',
+    'Emergency contact N°': 'emergency_contact',
+    'Address': 'address',
+    'Attempts': 'attempts',
+    'Chosen School': 'chosen_school',
+    'Specialite': 'specialite',
+    'Duration': 'duration',
+    'School Entry Date': 'school_entry_date',
+    'Entry Date in the US': 'entry_date_in_us',
+    'ADDRESS in the U.S': 'address_us',
+    'E-MAIL RDV': 'email_rdv',
+    'PASSWORD RDV': 'password_rdv',
+    'EMBASSY ITW. DATE': 'embassy_itw_date',
+    'DS-160 maker': 'ds160_maker',
+    'Password DS-160': 'password_ds160',
+    'Secret Q.': 'secret_q',
+    'Visa Result': 'Visa Result',
+    'Stage': 'current_stage',
+    'DATE': 'payment_date',
+    'BANK': 'Bankstatment',
+    'Gender': 'Gender',
+    'Payment Amount': 'Payment Method',
+    'Payment Type': 'Payment Type',
+    'Compte': 'Compte',
+    'School Paid': 'School_Paid',
+    'Prep ITW': 'Prep_ITW',
+    'Age': 'Age',
+    'Sevis payment ?': 'Sevis Payment',
+    'Agent': 'Agent',
+    'Application payment ?': 'Application payment ?',
+}
+
+# Function to remember the record an edit starts from, so a save can tell our changes from other agents'
+def edit_base(key, student_id, record):
+    base = st.session_state.get(key)
+    if base is None or base['student_id'] != student_id:
+        in_sync = st.session_state.get('roster_version') == get_roster_version()
+        base = {
+            'student_id': student_id,
+            'record': dict(record),
+            # Only trusted when the record shown is the store's current version
+            'fingerprint': get_roster_store().fingerprint(student_id) if in_sync else None,
+        }
+        st.session_state[key] = base
+    return base
 
 
 def format_date(date_string):
@@ -236,9 +164,14 @@ def format_date(date_string):
     except:
         return "Invalid Date"
 
-def clear_cache_and_rerun():
-    st.cache_data.clear()
-    st.cache_resource.clear()
+# Refresh only what a document change touched: this student's document status
+# and roster row. Credentials, clients and everyone else's data stay cached.
+def refresh_student_and_rerun(student_id, student_name):
+    refresh_document_status(student_name)
+    try:
+        refresh_student(student_id)
+    except Exception as e:
+        logger.error(f"Could not refresh roster row for {student_name}: {str(e)}")
     st.rerun()
 
 # Function to calculate days until interview
@@ -264,23 +197,27 @@ def get_visa_status(result):
     }
     return result_mapping.get(result, 'Unknown')
 
-@cache_with_timeout(timeout_minutes=5)
 def check_folder_exists(folder_name, parent_id=None):
+    key = ('folder', parent_id, folder_name)
+    hit, folder_id = get_drive_cache().get(key)
+    if hit:
+        return folder_id
     try:
         service = get_google_drive_service()
         query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder'"
         if parent_id:
             query += f" and '{parent_id}' in parents"
 
-        results = retry_request(lambda: service.files().list(q=query, spaces='drive', fields='files(id, name)').execute())
+        # Quota and server errors are retried by the request scheduler
+        results = service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
         folders = results.get('files', [])
-        if folders:
-            return folders[0].get('id')
-        else:
-            return None
+        folder_id = folders[0].get('id') if folders else None
     except Exception as e:
+        # Errors are not cached; only real "not found" answers are
         logger.error(f"An error occurred while checking if folder exists: {str(e)}")
         return None
+    get_drive_cache().set(key, folder_id)
+    return folder_id
 
 # Function to create a new folder in Google Drive
 def create_folder_in_drive(folder_name, parent_id=None):
@@ -293,26 +230,29 @@ def create_folder_in_drive(folder_name, parent_id=None):
         folder_metadata['parents'] = [parent_id]
     
     folder = service.files().create(body=folder_metadata, fields='id').execute()
-    return folder.get('id')
+    folder_id = folder.get('id')
+    # Replace any cached "not found" for this folder
+    get_drive_cache().set(('folder', parent_id, folder_name), folder_id)
+    return folder_id
 
 # Function to check if a file exists in a folder
 from googleapiclient.errors import HttpError
 
-@cache_with_timeout(timeout_minutes=5)
 def check_file_exists(file_name, student_folder_id, document_type):
+    key = ('file', student_folder_id, document_type, file_name)
+    hit, file_exists = get_drive_cache().get(key)
+    if hit:
+        return file_exists
+
     service = get_google_drive_service()
     
     # First, find the document type folder within the student folder
-    document_folder_query = f"name = '{document_type}' and '{student_folder_id}' in parents and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
-    document_folder_results = service.files().list(q=document_folder_query, spaces='drive', fields='files(id)').execute()
-    document_folders = document_folder_results.get('files', [])
+    document_folder_id = check_folder_exists(document_type, student_folder_id)
     
-    if not document_folders:
+    if not document_folder_id:
         logger.info(f"Document folder '{document_type}' not found in student folder.")
         return False
     
-    document_folder_id = document_folders[0]['id']
-    
     # Now check for the file within the document type folder
     file_query = f"name = '{file_name}' and '{document_folder_id}' in parents and trashed = false"
     try:
@@ -325,54 +265,130 @@ def check_file_exists(file_name, student_folder_id, document_type):
         files = results.get('files', [])
         file_exists = len(files) > 0
         logger.info(f"File '{file_name}' exists: {file_exists}")
-        return file_exists
     except HttpError as error:
         logger.error(f"An error occurred while checking if file exists: {error}")
         return False
+    get_drive_cache().set(key, file_exists)
+    return file_exists
 
 # Function to handle file upload and folder creation
-def handle_file_upload(student_name, document_type, uploaded_file):
-    parent_folder_id = '1It91HqQDsYeSo1MuYgACtmkmcO82vzXp'  # Use the provided parent folder ID
-    
-    # Check if student folder exists, if not create it
-    student_folder_id = check_folder_exists(student_name, parent_folder_id)
-    if not student_folder_id:
-        student_folder_id = create_folder_in_drive(student_name, parent_folder_id)
-        logger.info(f"Created new folder for student: {student_name}")
-    
-    # Check if document type folder exists within student folder, if not create it
-    document_folder_id = check_folder_exists(document_type, student_folder_id)
-    if not document_folder_id:
-        document_folder_id = create_folder_in_drive(document_type, student_folder_id)
-        logger.info(f"Created new folder for document type: {document_type}")
-    
-    file_name = uploaded_file.name
-    
+# Function to find a folder, creating it if it does not exist
+def ensure_folder(folder_name, parent_id):
+    folder_id = check_folder_exists(folder_name, parent_id)
+    if not folder_id:
+        folder_id = create_folder_in_drive(folder_name, parent_id)
+        logger.info(f"Created new folder: {folder_name}")
+    return folder_id
+
+def clean_file_name(file_name):
     # Ensure no double extensions
     if file_name.lower().endswith('.pdf.pdf'):
         file_name = file_name[:-4]
+    return file_name
+
+def handle_file_upload(student_name, document_type, uploaded_file):
+    # Check if the student and document type folders exist, if not create them
+    student_folder_id = ensure_folder(student_name, PARENT_FOLDER_ID)
+    document_folder_id = ensure_folder(document_type, student_folder_id)
+    
+    file_name = clean_file_name(uploaded_file.name)
     
     file_exists = check_file_exists(file_name, student_folder_id, document_type)
     if not file_exists:
-        with st.spinner(f"Uploading {file_name}..."):
-            temp_file_path = f"/tmp/{file_name}"
-            with open(temp_file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            mime_type = uploaded_file.type
-            file_id = upload_file_to_drive(temp_file_path, mime_type, document_folder_id)
-            os.remove(temp_file_path)
+        progress_bar = st.progress(0.0, text=f"Uploading {file_name}...")
+        # The uploaded file is already in memory; stream it straight to Drive
+        file_id = upload_file_to_drive(
+            uploaded_file, file_name, uploaded_file.type, document_folder_id,
+            progress=lambda fraction: progress_bar.progress(fraction, text=f"Uploading {file_name}... {int(fraction * 100)}%")
+        )
+        progress_bar.empty()
         if file_id:
-            st.success(f"{file_name} uploaded successfully!")
-            if 'document_status_cache' in st.session_state:
-                st.session_state['document_status_cache'].pop(student_name, None)
-            st.rerun()
+            st.session_state.upload_success = True
+            get_drive_cache().set(('file', student_folder_id, document_type, file_name), True)
             return file_id
     else:
         st.warning(f"{file_name} already exists for this student in the {document_type} folder.")
     
     return None
 
-async def fetch_document_status(session, document_type, student_folder_id, service):
+# Batch uploads run this many transfers at once
+UPLOAD_CONCURRENCY = 4
+
+# Keywords used to preselect the document type of each file in a batch
+DOCUMENT_TYPE_KEYWORDS = [
+    ("SEVIS Receipt", ["sevis"]),
+    ("I20", ["i20", "i-20", "i_20"]),
+    ("Passport", ["passport", "passeport"]),
+    ("Bank Statement", ["bank", "releve", "statement"]),
+    ("Financial Letter", ["financial", "sponsor", "attestation"]),
+    ("Transcripts", ["transcript", "releve de notes", "notes"]),
+    ("Diplomas", ["diploma", "diplome", "bac"]),
+    ("English Test", ["english", "toefl", "ielts", "duolingo"]),
+    ("Payment Receipt", ["receipt", "payment", "recu"]),
+]
+
+def guess_document_type(file_name):
+    name = file_name.lower()
+    for document_type, keywords in DOCUMENT_TYPE_KEYWORDS:
+        if any(keyword in name for keyword in keywords):
+            return DOCUMENT_TYPES.index(document_type)
+    return 0
+
+# Function to upload many documents for one student: folders are resolved once
+# per document type, then the files are sent in parallel by a bounded worker pool.
+# `files` is a list of (document type, uploaded file); returns (uploaded, skipped, failed) file names.
+def upload_documents_batch(student_name, files, progress=None):
+    student_folder_id = ensure_folder(student_name, PARENT_FOLDER_ID)
+    folder_ids = {document_type: ensure_folder(document_type, student_folder_id)
+                  for document_type in {document_type for document_type, _ in files}}
+
+    uploaded, skipped, failed = [], [], []
+    jobs = []
+    for document_type, uploaded_file in files:
+        file_name = clean_file_name(uploaded_file.name)
+        if check_file_exists(file_name, student_folder_id, document_type):
+            skipped.append(file_name)
+        else:
+            jobs.append((document_type, file_name, uploaded_file))
+
+    def upload(job):
+        document_type, file_name, uploaded_file = job
+        return upload_file_to_drive(uploaded_file, file_name, uploaded_file.type, folder_ids[document_type])
+
+    with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY, thread_name_prefix="upload") as pool:
+        futures = {pool.submit(upload, job): job for job in jobs}
+        for done, future in enumerate(as_completed(futures), start=1):
+            document_type, file_name, _ = futures[future]
+            try:
+                if future.result():
+                    uploaded.append(file_name)
+                    get_drive_cache().set(('file', student_folder_id, document_type, file_name), True)
+                else:
+                    failed.append(file_name)
+            except Exception as e:
+                logger.error(f"Upload of {file_name} failed: {str(e)}")
+                failed.append(file_name)
+            if progress:
+                progress(done / len(jobs), file_name)
+
+    refresh_document_status(student_name)
+    return uploaded, skipped, failed
+
+# Drive calls for the Document Status panel run on a small thread pool with a timeout;
+# the shared Drive service hands each call its own pooled connection
+DRIVE_CONCURRENCY = 10
+DRIVE_REQUEST_TIMEOUT = 10
+
+@st.cache_resource
+def get_drive_executor():
+    return ThreadPoolExecutor(max_workers=DRIVE_CONCURRENCY, thread_name_prefix="drive")
+
+async def execute_async(request):
+    loop = asyncio.get_running_loop()
+    call = loop.run_in_executor(get_drive_executor(), request.execute)
+    return await asyncio.wait_for(call, timeout=DRIVE_REQUEST_TIMEOUT)
+
+async def fetch_document_status(document_type, student_folder_id, service):
     document_folder_id = await check_folder_exists_async(document_type, student_folder_id, service)
     if document_folder_id:
         files = await list_files_in_folder_async(document_folder_id, service)
@@ -380,27 +396,24 @@ async def fetch_document_status(session, document_type, student_folder_id, servi
     return document_type, False, []
 
 async def check_document_status_async(student_name, service):
-    parent_folder_id = '1It91HqQDsYeSo1MuYgACtmkmcO82vzXp'
-    student_folder_id = await check_folder_exists_async(student_name, parent_folder_id, service)
+    student_folder_id = await check_folder_exists_async(student_name, PARENT_FOLDER_ID, service)
     
-    document_types = ["Passport", "Bank Statement", "Financial Letter", 
-                      "Transcripts", "Diplomas", "English Test", "Payment Receipt",
-                      "SEVIS Receipt", "I20"]
-    document_status = {doc_type: {'status': False, 'files': []} for doc_type in document_types}
+    document_types = DOCUMENT_TYPES
+    document_status = empty_status()
 
     if not student_folder_id:
         logger.info(f"Student folder not found for {student_name}")
         return document_status
 
-    async with aiohttp.ClientSession() as session:
-        tasks = [
-            fetch_document_status(session, document_type, student_folder_id, service)
-            for document_type in document_types
-        ]
-        results = await asyncio.gather(*tasks)
-        for doc_type, status, files in results:
-            document_status[doc_type] = {'status': status, 'files': files}
-            logger.info(f"Document status for {doc_type}: {status}, Files: {files}")
+    # All document types are looked up at the same time
+    tasks = [
+        fetch_document_status(document_type, student_folder_id, service)
+        for document_type in document_types
+    ]
+    results = await asyncio.gather(*tasks)
+    for doc_type, status, files in results:
+        document_status[doc_type] = {'status': status, 'files': files}
+        logger.info(f"Document status for {doc_type}: {status}, Files: {files}")
     
     return document_status
 
@@ -410,7 +423,8 @@ async def check_folder_exists_async(folder_name, parent_id, service):
         if parent_id:
             query += f" and '{parent_id}' in parents"
 
-        results = service.files().list(q=query, spaces='drive', fields='files(id, name)').execute()
+        request = service.files().list(q=query, spaces='drive', fields='files(id, name)')
+        results = await execute_async(request)
         folders = results.get('files', [])
         return folders[0].get('id') if folders else None
     except Exception as e:
@@ -420,7 +434,8 @@ async def check_folder_exists_async(folder_name, parent_id, service):
 async def list_files_in_folder_async(folder_id, service):
     try:
         query = f"'{folder_id}' in parents and trashed=false"
-        results = service.files().list(q=query, spaces='drive', fields='files(id, name, webViewLink)').execute()
+        request = service.files().list(q=query, spaces='drive', fields='files(id, name, webViewLink)')
+        results = await execute_async(request)
         return results.get('files', [])
     except Exception as e:
         logger.error(f"An error occurred while listing files in folder: {str(e)}")
@@ -435,9 +450,10 @@ def trash_file_in_drive(file_id, student_name):
             body={"trashed": True}
         ).execute()
         
-        # Clear the document status cache for this student
-        if 'document_status_cache' in st.session_state:
-            st.session_state['document_status_cache'].pop(student_name, None)
+        # Forget cached file lookups for this student
+        student_folder_id = check_folder_exists(student_name, PARENT_FOLDER_ID)
+        if student_folder_id:
+            get_drive_cache().invalidate_prefix(('file', student_folder_id))
         
         return True
     
@@ -445,16 +461,16 @@ def trash_file_in_drive(file_id, student_name):
         st.error(f"An error occurred while moving the file to trash: {str(e)}")
         return False
 
+# Document status comes from the shared index of the whole Drive tree
 def get_document_status(student_name):
-    if 'document_status_cache' not in st.session_state:
-        st.session_state['document_status_cache'] = {}
-    if student_name in st.session_state['document_status_cache']:
-        return st.session_state['document_status_cache'][student_name]
-    else:
-        service = get_google_drive_service()
-        document_status = asyncio.run(check_document_status_async(student_name, service))
-        st.session_state['document_status_cache'][student_name] = document_status
-        return document_status
+    return get_document_index().status_for(get_google_drive_service(), student_name)
+
+# Function to re-read one student's folder after an upload or delete
+def refresh_document_status(student_name):
+    service = get_google_drive_service()
+    document_status = asyncio.run(check_document_status_async(student_name, service))
+    get_document_index().set_student(student_name, document_status)
+    return document_status
 
 # Debouncing inputs for edit mode
 debounce_lock = threading.Lock()
@@ -572,17 +588,21 @@ def main():
     """, unsafe_allow_html=True)
 
     spreadsheet_id = "1os1G3ri4xMmJdQSNsVSNx6VJttyM8JsPNbmH0DCFUiI"
-    
-    if 'data' not in st.session_state or st.session_state.get('reload_data', False):
-        data = load_data(spreadsheet_id)
+
+    # Rerun this page whenever the background refresher publishes a new roster version
+    watch_roster()
+    show_sync_status()
+
+    # Reload when asked to, or when another session has refreshed the shared roster
+    if ('data' not in st.session_state or st.session_state.get('reload_data', False)
+            or st.session_state.get('roster_version') != get_roster_version()):
+        data = load_data(spreadsheet_id, force=st.session_state.get('reload_data', False))
         st.session_state['data'] = data
+        st.session_state['roster_version'] = get_roster_version()
         st.session_state['reload_data'] = False
     else:
         data = st.session_state['data']
 
-    # Combine First Name and Last Name for all rows
-    data['Student Name'] = data['First Name'] + " " + data['Last Name']
-
     if not data.empty:
         current_steps = ["All"] + list(data['Stage'].unique())
         agents = ["All", "Nesrine", "Hamza", "Djazila","Nada"]
@@ -615,10 +635,8 @@ def main():
         if attempts_filter != "All":
             filtered_data = filtered_data[filtered_data['Attempts'] == attempts_filter]
 
-        # Combine First Name and Last Name for filtered data
-        filtered_data['Student Name'] = filtered_data['First Name'] + " " + filtered_data['Last Name']
-
-        student_names = filtered_data['Student Name'].tolist()
+        student_ids = filtered_data.index.tolist()
+        labels = student_labels(filtered_data)
         
         if not filtered_data.empty:
             st.markdown('<div class="stCard" style="display: flex; justify-content: space-between;">', unsafe_allow_html=True)
@@ -627,9 +645,10 @@ def main():
             with col2:
                 search_query = st.selectbox(
                     "🔍 Search for a student (First or Last Name)",
-                    options=student_names,
+                    options=student_ids,
+                    format_func=labels.get,
                     key="search_query",
-                    index=student_names.index(st.session_state.selected_student) if st.session_state.selected_student in student_names else 0,
+                    index=student_ids.index(st.session_state.selected_student) if st.session_state.selected_student in labels else 0,
                     on_change=on_student_select
                 )
                 # After the selectbox:
@@ -640,33 +659,36 @@ def main():
                 st.subheader("📝 Student Notes")
                 
                 # Get the current note for the selected student
-                selected_student = filtered_data[filtered_data['Student Name'] == search_query].iloc[0]
+                selected_student = filtered_data.loc[search_query]
                 current_note = selected_student['Note'] if 'Note' in selected_student else ""
+                note_base = edit_base('note_base', search_query, {'Note': current_note})
             
                 # Create a text area for note input
                 new_note = st.text_area("Enter/Edit Note:", value=current_note, height=150, key="note_input")
             
                 # Save button for the note
                 if st.button("Save Note"):
-                    # Update the note in the original DataFrame (not the filtered one)
-                    st.session_state['data'].loc[st.session_state['data']['Student Name'] == search_query, 'Note'] = new_note
-                    
-                    # Save the updated data back to Google Sheets
-                    save_data(st.session_state['data'], spreadsheet_id, 'ALL')
-                    
-                    st.success("Note saved successfully!")
-                    
-                    # Set a flag to reload data on next run
-                    st.session_state['reload_data'] = True
-                    
-                    # Rerun the app to show updated data
-                    st.rerun()
+                    changes = diff_record(note_base['record'], {'Note': new_note})
+                    if not changes:
+                        st.info("No changes to save.")
+                    else:
+                        saved, conflicts = save_data(search_query, changes, selected_student['Student Name'],
+                                                     note_base['record'])
+                        # The next edit starts from the note as it is now
+                        st.session_state['note_base'] = None
+                        if not saved:
+                            st.error("Failed to save the note. Please try again.")
+                        elif conflicts:
+                            show_conflicts(conflicts)
+                        else:
+                            st.success("Note saved successfully!")
+                            # Rerun the app to show updated data
+                            st.rerun()
               
 
             
             with col1:
                 st.subheader("Application Status")
-                selected_student = filtered_data[filtered_data['Student Name'] == search_query].iloc[0]
                 steps = ['PAYMENT & MAIL', 'APPLICATION', 'SCAN & SEND', 'ARAMEX & RDV', 'DS-160', 'ITW Prep.',  'CLIENTS ']
                 current_step = selected_student['Stage']
                 step_index = steps.index(current_step) if current_step in steps else 0
@@ -739,19 +761,25 @@ def main():
                             if st.button("🗑️", key=f"delete_{status_info['files'][0]['id']}", help="Delete file"):
                                 file_id = status_info['files'][0]['id']
                                 if trash_file_in_drive(file_id, student_name):
-                                    st.session_state['reload_data'] = True
-                                    clear_cache_and_rerun()
+                                    refresh_student_and_rerun(selected_student.name, student_name)
         
         else:
             st.info("No students found matching the search criteria.")
 
                                     
         if not filtered_data.empty:
-            selected_student = filtered_data[filtered_data['Student Name'] == search_query].iloc[0]
+            selected_student = filtered_data.loc[search_query]
             student_name = selected_student['Student Name']
 
             edit_mode = st.toggle("Edit Mode", value=False)
 
+            # Saves are compared with the record as it was when editing started
+            if edit_mode:
+                student_base = edit_base('student_base', search_query, selected_student)
+            else:
+                st.session_state['student_base'] = None
+                st.session_state['edit_widgets'] = None
+
             # Tabs for student information
             tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["Personal", "School", "Embassy", "Payment","Stage", "Documents"])
             
@@ -1027,85 +1055,98 @@ def main():
             with tab6:
                 st.markdown('<div class="stCard">', unsafe_allow_html=True)
                 st.subheader("📂 Document Upload and Status")
-                document_type = st.selectbox("Select Document Type",
-                                             ["Passport", "Bank Statement", "Financial Letter",
-                                              "Transcripts", "Diplomas", "English Test", "Payment Receipt",
-                                              "SEVIS Receipt", "I20"],
-                                             key="document_type")
+                document_type = st.selectbox("Select Document Type", DOCUMENT_TYPES, key="document_type")
                 uploaded_file = st.file_uploader("Upload Document", type=["jpg", "jpeg", "png", "pdf"], key="uploaded_file")
 
                 if uploaded_file and st.button("Upload Document"):
                     file_id = handle_file_upload(student_name, document_type, uploaded_file)
                     if file_id:
                         st.success(f"{document_type} uploaded successfully!")
-                        if 'document_status_cache' in st.session_state:
-                            st.session_state['document_status_cache'].pop(student_name, None)
-                        clear_cache_and_rerun()  # Clear cache and rerun the app
+                        refresh_student_and_rerun(selected_student.name, student_name)
                     else:
                         st.error("An error occurred while uploading the document.")
+
+                # Batch mode: several files at once, each with its own document type
+                st.markdown("**📦 Upload several documents**")
+                if st.session_state.get('batch_upload_message'):
+                    st.success(st.session_state.pop('batch_upload_message'))
+                upload_round = st.session_state.get('batch_upload_round', 0)
+                batch_files = st.file_uploader("Upload Documents", type=["jpg", "jpeg", "png", "pdf"],
+                                               accept_multiple_files=True, key=f"batch_files_{upload_round}")
+                if batch_files:
+                    batch = []
+                    for i, batch_file in enumerate(batch_files):
+                        batch_type = st.selectbox(f"Type for {batch_file.name}", DOCUMENT_TYPES,
+                                                  index=guess_document_type(batch_file.name),
+                                                  key=f"batch_type_{upload_round}_{i}")
+                        batch.append((batch_type, batch_file))
+                    if st.button(f"Upload All ({len(batch)})"):
+                        progress_bar = st.progress(0.0, text="Uploading documents...")
+                        uploaded, skipped, failed = upload_documents_batch(
+                            student_name, batch,
+                            progress=lambda fraction, name: progress_bar.progress(fraction, text=f"Uploaded {name}")
+                        )
+                        progress_bar.empty()
+                        if failed:
+                            st.error(f"Failed to upload: {', '.join(failed)}")
+                        if skipped:
+                            st.warning(f"Already in Drive, skipped: {', '.join(skipped)}")
+                        if uploaded and not failed:
+                            st.session_state['batch_upload_message'] = f"{len(uploaded)} documents uploaded successfully!"
+                            # A new key clears the uploader after the rerun
+                            st.session_state['batch_upload_round'] = upload_round + 1
+                            st.rerun()
             if edit_mode:
+                # Widget values as first shown for this student. Dropdowns fall back to their first
+                # option and date pickers drop the time of day, so comparing with the record alone
+                # would write fields nobody touched. Kept across a conflict so "Save again" still has the edits.
+                shown_values = st.session_state.get('edit_widgets')
+                if shown_values is None or shown_values['student_id'] != search_query:
+                    shown_values = {'student_id': search_query,
+                                    'values': {key: st.session_state.get(key) for key in EDIT_WIDGETS.values()}}
+                    st.session_state['edit_widgets'] = shown_values
 
                 if st.button("Save Changes", key="save_changes_button"):
                     try:
-                        # Prepare the updated student data
-                        updated_student = {
-                            'First Name': st.session_state.get('first_name', selected_student['First Name']),
-                            'Last Name': st.session_state.get('last_name', selected_student['Last Name']),
-                            'Phone N°': st.session_state.get('phone_number', selected_student['Phone N°']),
-                            'E-mail': st.session_state.get('email', selected_student['E-mail']),
-                            'Emergency contact N°': st.session_state.get('emergency_contact', selected_student['Emergency contact N°']),
-                            'Address': st.session_state.get('address', selected_student['Address']),
-                            'Attempts': st.session_state.get('attempts', selected_student['Attempts']),
-                            'Chosen School': st.session_state.get('chosen_school', selected_student['Chosen School']),
-                            'Specialite': st.session_state.get('specialite', selected_student['Specialite']),
-                            'Duration': st.session_state.get('duration', selected_student['Duration']),
-                            'School Entry Date': st.session_state.get('school_entry_date', selected_student['School Entry Date']),
-                            'Entry Date in the US': st.session_state.get('entry_date_in_us', selected_student['Entry Date in the US']),
-                            'ADDRESS in the U.S': st.session_state.get('address_us', selected_student['ADDRESS in the U.S']),
-                            'E-MAIL RDV': st.session_state.get('email_rdv', selected_student['E-MAIL RDV']),
-                            'PASSWORD RDV': st.session_state.get('password_rdv', selected_student['PASSWORD RDV']),
-                            'EMBASSY ITW. DATE': st.session_state.get('embassy_itw_date', selected_student['EMBASSY ITW. DATE']),
-                            'DS-160 maker': st.session_state.get('ds160_maker', selected_student['DS-160 maker']),
-                            'Password DS-160': st.session_state.get('password_ds160', selected_student['Password DS-160']),
-                            'Secret Q.': st.session_state.get('secret_q', selected_student['Secret Q.']),
-                            'Visa Result': st.session_state.get('Visa Result', selected_student['Visa Result']),
-                            'Stage': st.session_state.get('current_stage', selected_student['Stage']),
-                            'DATE': st.session_state.get('payment_date', selected_student['DATE']),
-                            'BANK': st.session_state.get('Bankstatment', selected_student['BANK']),
-                            'Gender': st.session_state.get('Gender', selected_student['Gender']),
-                            'Payment Amount': st.session_state.get('Payment Method', selected_student['Payment Amount']),
-                            'Payment Type': st.session_state.get('Payment Type', selected_student['Payment Type']),
-                            'Compte': st.session_state.get('Compte', selected_student['Compte']),
-                            'School Paid': st.session_state.get('School_Paid', selected_student['School Paid']),
-                            'Prep ITW': st.session_state.get('Prep_ITW', selected_student['Prep ITW']),
-                            'Age': st.session_state.get('Age', selected_student['Age']),
-                            'Sevis payment ?': st.session_state.get('Sevis Payment', selected_student['Sevis payment ?']),
-                            'Agent': st.session_state.get('Agent', selected_student['Agent']),
-                            'Application payment ?': st.session_state.get('Application payment ?', selected_student['Application payment ?']),
-                        }
-                
-                        original_data = st.session_state['data']
+                        # Prepare the updated student data from the widgets the user changed
+                        updated_student = {col: st.session_state[key] for col, key in EDIT_WIDGETS.items()
+                                           if key in st.session_state
+                                           and st.session_state[key] != shown_values['values'].get(key)}
                 
-                        # Apply the changes to the original data
-                        for key, value in updated_student.items():
-                            original_data.loc[original_data['Student Name'] == student_name, key] = value
-                
-                        # Ensure the "Student Name" column is updated
-                        original_data['Student Name'] = original_data['First Name'] + " " + original_data['Last Name']
-                
-                        # Save the original data back to Google Sheets
-                        if save_data(original_data, spreadsheet_id, 'ALL', student_name):
-                            st.success("Changes saved successfully!")
-                            st.session_state['reload_data'] = True
-                            st.cache_data.clear()
-                            with st.spinner("Refreshing data..."):
-                                time.sleep(2)
-                            st.rerun()
+                        # Keep the "Student Name" column in step with the name fields
+                        if 'First Name' in updated_student or 'Last Name' in updated_student:
+                            new_first = updated_student.get('First Name', selected_student['First Name'])
+                            new_last = updated_student.get('Last Name', selected_student['Last Name'])
+                            updated_student['Student Name'] = f"{new_first} {new_last}"
+
+                        # Only the fields that differ from the record the edit started from are written
+                        changes = diff_record(student_base['record'], updated_student)
+                        if not changes:
+                            st.info("No changes to save.")
                         else:
-                            st.error("Failed to save changes. Please try again.")
+                            saved, conflicts = save_data(selected_student.name, changes, student_name,
+                                                         student_base['record'], student_base['fingerprint'])
+                            # The next edit starts from the record as it is now
+                            st.session_state['student_base'] = None
+                            if not saved:
+                                st.error("Failed to save changes. Please try again.")
+                            elif conflicts:
+                                show_conflicts(conflicts)
+                            else:
+                                st.success("Changes saved successfully!")
+                                st.session_state['edit_widgets'] = None
+                                # The shared roster was patched by save_data; the rerun picks up the new version
+                                st.rerun()
                     except Exception as e:
                         st.error(f"An error occurred while saving: {str(e)}")
                     
+        with st.expander("📂 Missing Documents (all students)"):
+            missing = missing_documents(get_google_drive_service(), filtered_data)
+            if missing.empty:
+                st.write("Every student in this selection has all their documents.")
+            else:
+                st.dataframe(missing.sort_values('Missing Count', ascending=False), use_container_width=True, hide_index=True)
+
     else:
         st.error("No data available. Please check your Google Sheets connection and data.")
 
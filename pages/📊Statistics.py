@@ -1,52 +1,17 @@
 import pandas as pd
 import plotly.express as px
-from google.oauth2.service_account import Credentials
-import gspread
 import streamlit as st
 from datetime import datetime
+from roster import get_roster_store
+from statistics_cube import approval_rate, get_statistics_cube_cache
 
-# Use Streamlit secrets for service account info
-SERVICE_ACCOUNT_INFO = st.secrets["gcp_service_account"]
+# Function to load the statistics cube of the current roster version
+def load_cube():
+    return get_statistics_cube_cache().get(get_roster_store())
 
-# Define the scopes
-SCOPES = ['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/auth/spreadsheets']
-
-# Authenticate and build the Google Sheets service
-@st.cache_resource
-def get_google_sheet_client():
-    creds = Credentials.from_service_account_info(SERVICE_ACCOUNT_INFO, scopes=SCOPES)
-    return gspread.authorize(creds)
-
-# Function to load data from Google Sheets
-def load_data(spreadsheet_id, sheet_name):
-    client = get_google_sheet_client()
-    sheet = client.open_by_key(spreadsheet_id).worksheet(sheet_name)
-    data = sheet.get_all_records()
-    df = pd.DataFrame(data)
-    return df
-
-def filter_data_by_date_range(data, start_date, end_date):
-    return data[(data['DATE'] >= start_date) & (data['DATE'] <= end_date)]
-
-def filter_data_by_month_year(data, year, month):
+def month_range(year, month):
     start_date = pd.Timestamp(year=year, month=month, day=1)
-    end_date = start_date + pd.offsets.MonthEnd(1)
-    return data[(data['DATE'] >= start_date) & (data['DATE'] <= end_date)]
-
-def calculate_visa_approval_rate(data):
-    # Filter for applications where a decision has been made
-    decided_applications = data[data['Visa Result'].isin(['Visa Approved', 'Visa Denied'])]
-    
-    # Calculate total decided applications
-    total_decided = len(decided_applications)
-    
-    # Calculate number of approved visas
-    approved_visas = len(decided_applications[decided_applications['Visa Result'] == 'Visa Approved'])
-    
-    # Calculate approval rate
-    approval_rate = (approved_visas / total_decided * 100) if total_decided > 0 else 0
-    
-    return approval_rate, approved_visas, total_decided
+    return start_date, start_date + pd.offsets.MonthEnd(1)
 
 def statistics_page():
     st.set_page_config(page_title="Student Recruitment Statistics", layout="wide")
@@ -79,30 +44,13 @@ def statistics_page():
 
     st.title("📊 Student Recruitment Statistics")
 
-    # Load data from Google Sheets
-    spreadsheet_id = "1os1G3ri4xMmJdQSNsVSNx6VJttyM8JsPNbmH0DCFUiI"
-    sheet_name = "ALL"
-    data = load_data(spreadsheet_id, sheet_name)
+    # Student counts are pre-aggregated per day once per roster version, after removing
+    # near-duplicates and rows without a valid DATE; every chart below slices this cube
+    cube = load_cube()
 
-    # Convert 'DATE' column to datetime and handle NaT values
-    data['DATE'] = pd.to_datetime(data['DATE'], errors='coerce')
-
-    # Identify rows with incorrect date format in the original data
-    incorrect_date_mask = data['DATE'].isna()
-    incorrect_date_count = incorrect_date_mask.sum()
-    
-    # Create a DataFrame with students having incorrect date format
-    students_with_incorrect_dates = data[incorrect_date_mask]
-
-    # Remove duplicates based on Phone N° and E-mail
-    data_deduped = data.drop_duplicates(subset=['Phone N°', 'E-mail'], keep='last')
-    
-    # Remove rows with NaT values in the DATE column for further analysis
-    data_clean = data_deduped.dropna(subset=['DATE'])
-
-    min_date = data_clean['DATE'].min()
-    max_date = data_clean['DATE'].max()
-    years = list(range(min_date.year, max_date.year + 1))
+    min_date = cube.min_date
+    max_date = cube.max_date
+    years = list(range(min_date.year, max_date.year + 1)) if not pd.isna(min_date) else [datetime.now().year]
     months = list(range(1, 13))
 
     # Filter selection
@@ -120,19 +68,20 @@ def statistics_page():
         start_date = pd.Timestamp(start_date)
         end_date = pd.Timestamp(end_date)
         
-        filtered_data = filter_data_by_date_range(data_clean, start_date, end_date)
     else:
         selected_year = st.sidebar.selectbox("Year", years)
         selected_month = st.sidebar.selectbox("Month", months, format_func=lambda x: datetime(2023, x, 1).strftime('%B'))
-        filtered_data = filter_data_by_month_year(data_clean, selected_year, selected_month)
+        start_date, end_date = month_range(selected_year, selected_month)
+
+    filtered = cube.slice(start_date, end_date)
 
     # Calculate overall visa approval rate
-    overall_approval_rate, visa_approved, total_decisions = calculate_visa_approval_rate(filtered_data)
+    total_students, visa_approved, total_decisions = filtered.summary()
+    overall_approval_rate = approval_rate(visa_approved, total_decisions)
 
     col1, col2, col3 = st.columns(3)
 
     with col1:
-        total_students = len(filtered_data)
         st.metric("Total Unique Students", total_students)
 
     with col2:
@@ -147,7 +96,7 @@ def statistics_page():
 
     with col1:
         st.subheader("🏫 Top Chosen Schools")
-        school_counts = filtered_data['Chosen School'].value_counts().head(10).reset_index()
+        school_counts = filtered.counts('Chosen School').head(10).reset_index()
         school_counts.columns = ['School', 'Number of Students']
         fig = px.bar(school_counts, x='School', y='Number of Students',
                      labels={'Number of Students': 'Number of Students', 'School': 'School'},
@@ -156,7 +105,7 @@ def statistics_page():
 
     with col2:
         st.subheader("🛂 Student Visa Approval")
-        visa_status = filtered_data['Visa Result'].value_counts()
+        visa_status = filtered.counts('Visa Result')
         colors = {'Visa Approved': 'blue', 'Visa Denied': 'red', '0 not yet': 'grey', 'not our school': 'lightblue'}
         fig = px.pie(values=visa_status.values, names=visa_status.index,
                      title="Visa Application Results", color=visa_status.index, 
@@ -168,10 +117,7 @@ def statistics_page():
     # New section for Visa Approval Rate by School
     st.subheader("🏆 Top 8 Schools by Visa Approval Rate")
     
-    def school_approval_rate(group):
-        return calculate_visa_approval_rate(group)[0]
-    
-    school_visa_stats = filtered_data.groupby('Chosen School').apply(school_approval_rate).reset_index()
+    school_visa_stats = filtered.approval_rates('Chosen School').reset_index()
     school_visa_stats.columns = ['School', 'Approval Rate']
     
     # Sort by approval rate and get top 8
@@ -191,7 +137,7 @@ def statistics_page():
 
     with col1:
         st.subheader("📅 Applications Over Time")
-        monthly_apps = filtered_data.groupby(filtered_data['DATE'].dt.to_period("M")).size().reset_index(name='count')
+        monthly_apps = filtered.monthly().rename_axis('DATE').reset_index(name='count')
         monthly_apps['DATE'] = monthly_apps['DATE'].dt.to_timestamp()
         fig = px.line(monthly_apps, x='DATE', y='count',
                       labels={'count': 'Number of Applications', 'DATE': 'Date'},
@@ -200,7 +146,7 @@ def statistics_page():
 
     with col2:
         st.subheader("💰 Payment Methods")
-        payment_counts = filtered_data['Payment Type'].value_counts()
+        payment_counts = filtered.counts('Payment Type')
         fig = px.pie(values=payment_counts.values, names=payment_counts.index,
                      title="Payment Method Distribution")
         st.plotly_chart(fig, use_container_width=True)
@@ -211,14 +157,14 @@ def statistics_page():
 
     with col1:
         st.subheader("👥 Gender Distribution")
-        gender_counts = filtered_data['Gender'].value_counts()
+        gender_counts = filtered.counts('Gender')
         fig = px.pie(values=gender_counts.values, names=gender_counts.index,
                      title="Gender Distribution")
         st.plotly_chart(fig, use_container_width=True)
 
     with col2:
         st.subheader("🔄 Application Attempts")
-        attempts_counts = filtered_data['Attempts'].value_counts().reset_index()
+        attempts_counts = filtered.counts('Attempts').reset_index()
         attempts_counts.columns = ['Attempt', 'Number of Students']
         fig = px.bar(attempts_counts, x='Attempt', y='Number of Students',
                      labels={'Number of Students': 'Number of Students', 'Attempt': 'Attempt'},
@@ -228,7 +174,7 @@ def statistics_page():
     st.markdown("---")
 
     st.subheader("🏆 Top Performing Agents")
-    agent_performance = filtered_data['Agent'].value_counts().head(5).reset_index()
+    agent_performance = filtered.counts('Agent').head(5).reset_index()
     agent_performance.columns = ['Agent', 'Number of Students']
     fig = px.bar(agent_performance, x='Agent', y='Number of Students',
                  labels={'Number of Students': 'Number of Students', 'Agent': 'Agent'},
@@ -241,7 +187,7 @@ def statistics_page():
     st.header("💰 Top 5 Payment Types")
 
     # Count the number of payments in each category and get the top 5
-    payment_counts = filtered_data['Payment Amount'].value_counts().nlargest(5)
+    payment_counts = filtered.counts('Payment Amount').nlargest(5)
 
     # Create a bar chart for top 5 payment categories
     fig = px.bar(x=payment_counts.index, y=payment_counts.values,
@@ -266,11 +212,7 @@ def statistics_page():
     
     # Filter for specific payment amounts
     specific_payments = ['159.000 DZD', '139.000 DZD', '152.000 DZD', '132.000 DZD']
-    filtered_payments = data_clean[data_clean['Payment Amount'].isin(specific_payments)]
-    
-    # Group by month and year
-    filtered_payments['Month_Year'] = filtered_payments['DATE'].dt.to_period('M')
-    monthly_payment_counts = filtered_payments['Month_Year'].value_counts().sort_index().reset_index()
+    monthly_payment_counts = cube.slice().monthly('Payment Amount', specific_payments).reset_index()
     monthly_payment_counts.columns = ['Month_Year', 'Count']
     monthly_payment_counts['Month_Year'] = monthly_payment_counts['Month_Year'].astype(str)
 
@@ -1,11 +1,9 @@
 import streamlit as st
-import gspread
-from google.oauth2.service_account import Credentials
-import pandas as pd
-import numpy as np
-import time
 import logging
 from datetime import datetime
+from roster import STUDENT_ID_COLUMN, load_students
+from sheet_diff import diff_frames
+from write_queue import get_write_queue, show_sync_status
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -14,53 +12,34 @@ logger = logging.getLogger(__name__)
 # Page configuration
 st.set_page_config(page_title="Student List", layout="wide")
 
-# Use Streamlit secrets for service account info
-SERVICE_ACCOUNT_INFO = st.secrets["gcp_service_account"]
-
-# Define the required scope
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
-
-# Authenticate with Google Sheets
-def get_gsheet_client():
-    creds = Credentials.from_service_account_info(SERVICE_ACCOUNT_INFO, scopes=SCOPES)
-    return gspread.authorize(creds)
-
-client = get_gsheet_client()
-
-# Open the Google Sheet using the provided link
-spreadsheet_url = "https://docs.google.com/spreadsheets/d/1os1G3ri4xMmJdQSNsVSNx6VJttyM8JsPNbmH0DCFUiI/edit?gid=693781323#gid=693781323"
-
-# Function to load data from Google Sheets
-def load_data():
-    spreadsheet = client.open_by_url(spreadsheet_url)
-    sheet = spreadsheet.sheet1  # Adjust if you need to access a different sheet
-    data = sheet.get_all_records()
-    df = pd.DataFrame(data)
-    df['DATE'] = pd.to_datetime(df['DATE'], format='%d/%m/%Y %H:%M:%S', errors='coerce')  # Convert DATE to datetime with dayfirst=True
+# Function to load data from the shared roster
+def load_data(force=False):
+    # Rows are keyed by their stable Student ID so saves reach the right row
+    df = load_students(force=force).set_index(STUDENT_ID_COLUMN)
     df['Months'] = df['DATE'].dt.strftime('%B %Y')  # Create a new column 'Months' for filtering
     return df
 
-# Function to save data to Google Sheets
-def save_data(df, spreadsheet_url):
+# Function to save only the edited cells, new rows and deleted rows to Google Sheets.
+# Returns (saved, conflicts); conflicts are edited cells someone else changed since the table was loaded.
+def save_data(original, edited, shown_index, disabled_columns):
     logger.info("Attempting to save changes")
     try:
-        spreadsheet = client.open_by_url(spreadsheet_url)
-        sheet = spreadsheet.sheet1
-
-        # Replace problematic values with a placeholder
-        df.replace([np.inf, -np.inf, np.nan], 'NaN', inplace=True)
-
-        # Clear the existing sheet
-        sheet.clear()
-
-        # Update the sheet with new data
-        sheet.update([df.columns.values.tolist()] + df.values.tolist())
-
-        logger.info("Changes saved successfully")
-        return True
+        editable_columns = [col for col in edited.columns if col not in disabled_columns]
+        diff = diff_frames(original.astype(str), edited, shown_index, editable_columns)
+        if not diff:
+            logger.info("No changes to save")
+            return True, {}
+
+        # Applied to the shared roster now and sent to the sheet in one background batch;
+        # nothing is cleared, so a failed save leaves the sheet intact
+        conflicts = get_write_queue().enqueue_diff(diff)
+
+        logger.info(f"Changes queued: {len(diff.cells) - len(conflicts)} cells, "
+                    f"{len(diff.appended)} new rows, {len(diff.deleted)} deleted rows, {len(conflicts)} conflicts")
+        return True, conflicts
     except Exception as e:
         logger.error(f"Error saving changes: {str(e)}")
-        return False
+        return False, {}
 
 # Load data and initialize session state
 if 'data' not in st.session_state or st.session_state.get('reload_data', False):
@@ -70,6 +49,14 @@ if 'data' not in st.session_state or st.session_state.get('reload_data', False):
 
 # Display the editable dataframe
 st.title("Student List")
+show_sync_status()
+
+# Edits from the last save that were not written because someone else changed those cells first
+if st.session_state.get('save_conflicts'):
+    lines = [f"- **{name}**, {col}: now '{theirs}', yours '{ours}'"
+             for name, col, theirs, ours in st.session_state.pop('save_conflicts')]
+    st.warning("These cells were changed by someone else after the table was loaded, so your values were not saved. "
+               "The table now shows the current values; edit them again to overwrite:\n" + "\n".join(lines))
 
 # Filters
 col1, col2, col3, col4, col5 = st.columns(5)
@@ -126,8 +113,7 @@ if selected_schools and "All" not in selected_schools:
 if selected_attempts and "All" not in selected_attempts:
     filtered_data = filtered_data[filtered_data['Attempts'].isin(selected_attempts)]
 
-# Sort filtered data for display using DATE as day-first
-filtered_data['DATE'] = pd.to_datetime(filtered_data['DATE'], dayfirst=True, errors='coerce')
+# Sort filtered data for display; DATE is already parsed by the shared roster
 filtered_data.sort_values(by='DATE', inplace=True)
 
 # Ensure all columns are treated as strings for editing
@@ -147,20 +133,15 @@ edited_df = st.data_editor(
 # Update Google Sheet with edited data
 if st.button("Save Changes"):
     try:
-        # Only save changes for the editable columns, leave unchangeable columns as they are
-        for col in disabled_columns:
-            edited_df[col] = st.session_state.original_data[col]  # Revert any changes to the unchangeable columns
-        
-        st.session_state.original_data.update(edited_df)  # Update the original dataset with edited data
-        
-        if save_data(st.session_state.original_data, spreadsheet_url):
-            st.session_state.data = load_data()  # Reload the data to ensure consistency
+        # Only the editable columns are compared, so the unchangeable columns are left as they are
+        saved, conflicts = save_data(st.session_state.original_data, edited_df, filtered_data.index, disabled_columns)
+        if saved:
             st.success("Changes saved successfully!")
-            
-            # Use a spinner while waiting for changes to propagate
-            with st.spinner("Refreshing data..."):
-                time.sleep(2)  # Wait for 2 seconds to allow changes to propagate
-            
+            st.session_state.save_conflicts = [
+                (st.session_state.original_data.at[student_id, 'Student Name'], col, theirs, ours)
+                for (student_id, col), (theirs, ours) in conflicts.items()
+            ]
+            # The shared roster was patched by the save, so reloading it is immediate
             st.session_state.reload_data = True
             st.rerun()
         else:
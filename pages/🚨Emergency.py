@@ -1,98 +1,32 @@
 import streamlit as st
-import pandas as pd
-from datetime import datetime, timedelta
-from google.oauth2.service_account import Credentials
-import gspread
+from datetime import datetime
+from alerts import ALERT_RULES, get_alert_state
+from dedup import get_duplicate_groups_cache
+from roster import get_roster_store
+from roster_refresher import watch_roster
 
 # Set page config at the very beginning
 st.set_page_config(layout="wide", page_title="Student Visa CRM Dashboard")
 
-
-# Use Streamlit secrets for service account info
-SERVICE_ACCOUNT_INFO = st.secrets["gcp_service_account"]
-
-# Define the scopes
-SCOPES = ['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/auth/spreadsheets']
-
-
-# Authenticate and build the Google Sheets service
-@st.cache_resource
-def get_google_sheet_client():
-    creds = Credentials.from_service_account_info(SERVICE_ACCOUNT_INFO, scopes=SCOPES)
-    return gspread.authorize(creds)
-
-# Function to load data from Google Sheets
-def load_data(spreadsheet_id, sheet_name):
-    client = get_google_sheet_client()
-    sheet = client.open_by_key(spreadsheet_id).worksheet(sheet_name)
-    data = sheet.get_all_records()
-    df = pd.DataFrame(data)
-    return df
-
-# Load data
-spreadsheet_id = "1os1G3ri4xMmJdQSNsVSNx6VJttyM8JsPNbmH0DCFUiI"
-sheet_name = "ALL"
-data = load_data(spreadsheet_id, sheet_name)
-
-# Convert DATE columns to datetime with explicit format
-date_format = "%d/%m/%Y %H:%M:%S"
-data['DATE'] = pd.to_datetime(data['DATE'], format=date_format, errors='coerce')
-data['School Entry Date'] = pd.to_datetime(data['School Entry Date'], format=date_format, errors='coerce')
-data['EMBASSY ITW. DATE'] = pd.to_datetime(data['EMBASSY ITW. DATE'], format=date_format, errors='coerce')
+# Rerun the dashboard whenever the background refresher publishes a new roster version
+watch_roster()
 
 # Get today's date
 today = datetime.now()
 
-# Apply rules (as in your original code)
-# Rule 1: School payment 50 days before school entry, exclude students with Visa Denied
-data['School Payment Due'] = data['School Entry Date'] - timedelta(days=50)
-rule_1 = data[(data['School Paid'] != 'Yes') & (data['School Payment Due'] > today) & (data['Visa Result'] != 'Visa Denied')].sort_values(by='DATE').reset_index(drop=True)
-
-# Rule 2: DS-160 step within 30 days before embassy interview
-ds_160_stages = ['PAYMENT & MAIL', 'APPLICATION', 'SCAN & SEND', 'ARAMEX & RDV', 'DS-160', 'ITW Prep', 'CLIENTS']
-data['DS-160 Due'] = data['EMBASSY ITW. DATE'] - timedelta(days=30)
-rule_2 = data[(data['Stage'].isin(ds_160_stages[:5])) & (data['EMBASSY ITW. DATE'] > today) & (data['EMBASSY ITW. DATE'] <= today + timedelta(days=30))].sort_values(by='EMBASSY ITW. DATE').reset_index(drop=True)
-
-# Rule 3: Embassy interview in less than 14 days and stage is not CLIENT or SEVIS payment is NO
-rule_3a = data[(data['EMBASSY ITW. DATE'] > today) & (data['EMBASSY ITW. DATE'] <= today + timedelta(days=14)) & (data['Stage'] != 'CLIENT') & (data['Stage'] != 'CLIENTS')].sort_values(by='EMBASSY ITW. DATE').reset_index(drop=True)
-rule_3b = data[(data['EMBASSY ITW. DATE'] > today) & (data['EMBASSY ITW. DATE'] <= today + timedelta(days=14)) & (data['Sevis payment ?'] == 'NO')].sort_values(by='EMBASSY ITW. DATE').reset_index(drop=True)
-
-# Rule 4: One week after DATE and School Entry Date is still empty, exclude clients with stage 'CLIENTS'
-rule_4 = data[(data['DATE'] <= today - timedelta(days=14)) & (data['School Entry Date'].isna()) & (data['Stage'] != 'CLIENTS')].sort_values(by='DATE').reset_index(drop=True)
-
-# Rule 5: Two weeks after DATE and EMBASSY ITW. DATE is still empty, exclude clients with stage 'CLIENTS'
-rule_5 = data[(data['DATE'] <= today - timedelta(days=14)) & (data['EMBASSY ITW. DATE'].isna()) & (data['Stage'] != 'CLIENTS')].sort_values(by='DATE').reset_index(drop=True)
-
-# New Rule: EMBASSY ITW. DATE is passed today and Visa Result is empty
-rule_6 = data[(data['EMBASSY ITW. DATE'] < today) & (data['Visa Result'].isna())].sort_values(by='EMBASSY ITW. DATE').reset_index(drop=True)
-
+# Alert matches are kept per student and only re-checked for rows changed since the last version
+alert_state = get_alert_state()
+alerts, alert_timings = alert_state.results(get_roster_store(), today)
 
-rule_7 = data[
-    (
-        (data['Agent'].isna()) | 
-        (data['Agent'].str.strip() == '') | 
-        (data['Agent'].str.lower() == 'nan')
-    ) & 
-    (data['Stage'].str.strip().str.upper() != 'CLIENT') & 
-    (data['Stage'].str.strip().str.upper() != 'CLIENTS')
-].sort_values(by='DATE').reset_index(drop=True)
+# Per-rule timing of the last update, to spot rules that get slow as the roster grows
+with st.sidebar.expander("Alert rule timings"):
+    st.write(f"Rows re-checked: {alert_state.rows_evaluated}")
+    for rule in ALERT_RULES:
+        st.write(f"{rule['key']}: {len(alerts[rule['key']])} rows, {alert_timings[rule['key']] * 1000:.1f} ms")
 
-# Add this diagnostic print
-st.sidebar.write(f"Number of rows in rule_7: {len(rule_7)}")
-
-def find_duplicates(df):
-    # Combine First Name and Last Name
-    df['Full Name'] = df['First Name'] + ' ' + df['Last Name']
-    
-    # Find duplicates based on Full Name, Phone N°, or E-mail
-    duplicates = df[df.duplicated(subset=['Full Name', 'Phone N°', 'E-mail'], keep=False)]
-    
-    # Sort the duplicates for better readability
-    duplicates = duplicates.sort_values(by=['Full Name', 'Phone N°', 'E-mail'])
-    
-    return duplicates
-
-duplicate_students = find_duplicates(data)
+# Near-duplicates: same phone, same e-mail, or a same-sounding name with no conflicting contact details.
+# Found once per roster version and shared by every session
+duplicate_students = get_duplicate_groups_cache().get(get_roster_store())
 
 
 st.markdown("""
@@ -201,79 +135,35 @@ st.markdown("## Overview")
 col1, col2, col3, col4 = st.columns(4)
 
 with col1:
-    st.markdown(metric_card("School Payment Due", len(rule_1), "📅"), unsafe_allow_html=True)
+    st.markdown(metric_card("School Payment Due", len(alerts['school_payment']), "📅"), unsafe_allow_html=True)
 with col2:
-    st.markdown(metric_card("DS-160 Due", len(rule_2), "📝"), unsafe_allow_html=True)
+    st.markdown(metric_card("DS-160 Due", len(alerts['ds_160']), "📝"), unsafe_allow_html=True)
 with col3:
-    st.markdown(metric_card("Upcoming Interviews", len(rule_3a), "🎤"), unsafe_allow_html=True)
+    st.markdown(metric_card("Upcoming Interviews", len(alerts['interviews']), "🎤"), unsafe_allow_html=True)
 with col4:
-    st.markdown(metric_card("Need SEVIS Payment", len(rule_3b), "💳"), unsafe_allow_html=True)
+    st.markdown(metric_card("Need SEVIS Payment", len(alerts['sevis_payment']), "💳"), unsafe_allow_html=True)
 
 # Add some space before the tabs
 st.markdown("<br>", unsafe_allow_html=True)
 
-# Detailed sections in tabs with emojis
-tabs = st.tabs([
-    "📅 School Payment",
-    "📝 DS-160",
-    "🎤 Interviews",
-    "💳 SEVIS Payment",
-    "📄 I-20 ",
-    "📆 ARAMEX",
-    "🔍 Visa Result",
-    "👤 Unassigned Students",
-    "🔄 Duplicate Students"  # New tab
-])
-
-with tabs[0]:
-    st.markdown('<div class="section-header">📅 School Payment Due Soon</div>', unsafe_allow_html=True)
-    st.write("These students need to complete their school payment at least 50 days before their school entry date.")
-    st.dataframe(rule_1[['First Name', 'Last Name', 'DATE', 'School Payment Due', 'Stage', 'Agent']], use_container_width=True)
-
-with tabs[1]:
-    st.markdown('<div class="section-header">📝 DS-160 Step Due Soon</div>', unsafe_allow_html=True)
-    st.write("These students need to complete the DS-160 step within 30 days before their embassy interview date.")
-    st.dataframe(rule_2[['First Name', 'Last Name', 'DATE', 'EMBASSY ITW. DATE', 'Stage', 'Agent']], use_container_width=True)
+# Detailed sections in tabs with emojis, one per alert rule plus the duplicates tab
+tabs = st.tabs([rule['tab'] for rule in ALERT_RULES] + ["🔄 Duplicate Students"])
 
-with tabs[2]:
-    st.markdown('<div class="section-header">🎤 Upcoming Embassy Interviews (Need Prep)</div>', unsafe_allow_html=True)
-    st.write("These students have embassy interviews scheduled within the next 14 days and they are not prepared yet.")
-    st.dataframe(rule_3a[['First Name', 'Last Name', 'DATE', 'EMBASSY ITW. DATE', 'Stage', 'Agent']], use_container_width=True)
+for tab, rule in zip(tabs, ALERT_RULES):
+    with tab:
+        st.markdown(f'<div class="section-header">{rule["header"]}</div>', unsafe_allow_html=True)
+        st.write(rule['description'])
+        matches = alerts[rule['key']]
+        if len(matches) > 0 or 'empty_message' not in rule:
+            st.dataframe(matches[rule['columns']], use_container_width=True)
+        else:
+            st.write(rule['empty_message'])
 
-with tabs[3]:
-    st.markdown('<div class="section-header">💳 Need SEVIS Payment</div>', unsafe_allow_html=True)
-    st.write("These students have embassy interviews scheduled within the next 14 days and they did not pay the SEVIS.")
-    st.dataframe(rule_3b[['First Name', 'Last Name', 'DATE', 'EMBASSY ITW. DATE', 'Stage', 'Agent']], use_container_width=True)
-
-with tabs[4]:
-    st.markdown('<div class="section-header">📄 I-20 </div>', unsafe_allow_html=True)
-    st.write("These students do not have a school entry date recorded one week after the Payment date. They need an I-20 and must mention their entry date in the database.")
-    st.dataframe(rule_4[['First Name', 'Last Name', 'DATE', 'Stage', 'Agent']], use_container_width=True)
-
-with tabs[5]:
-    st.markdown('<div class="section-header">📆 ARAMEX</div>', unsafe_allow_html=True)
-    st.write("These students do not have an embassy interview date recorded two weeks after their initial registration date. They need to schedule their interview and update the database.")
-    st.dataframe(rule_5[['First Name', 'Last Name', 'DATE', 'Stage', 'Agent']], use_container_width=True)
-
-with tabs[6]:
-    st.markdown('<div class="section-header">🔍 Visa Result Needed</div>', unsafe_allow_html=True)
-    st.write("These students have passed their embassy interview date and still do not have a recorded visa result. Please update their visa result.")
-    st.dataframe(rule_6[['First Name', 'Last Name', 'DATE', 'EMBASSY ITW. DATE', 'Stage', 'Agent']], use_container_width=True)
-
-with tabs[7]:
-    st.markdown('<div class="section-header">👤 Unassigned Students</div>', unsafe_allow_html=True)
-    st.write("These students are not assigned an agent .")
-    
-    if len(rule_7) > 0:
-        st.dataframe(rule_7[['First Name', 'Last Name', 'DATE', 'Stage', 'Agent']], use_container_width=True)
-    else:
-        st.write("No unassigned students found. This could mean all students are properly assigned, or there might be an issue with the data or filtering condition.")
-        
-with tabs[8]:  # This is the new tab for duplicate students
+with tabs[-1]:  # This is the new tab for duplicate students
     st.markdown('<div class="section-header">🔄 Duplicate Students</div>', unsafe_allow_html=True)
-    st.write("These students appear to be duplicates based on matching Full Name, Phone N°, or E-mail.")
+    st.write("These students appear to be duplicates based on a matching Phone N° or E-mail, or a similar-sounding name with no conflicting contact details.")
     if len(duplicate_students) > 0:
-        st.dataframe(duplicate_students[['First Name', 'Last Name', 'Phone N°', 'E-mail', 'DATE', 'Stage', 'Agent']], use_container_width=True)
+        st.dataframe(duplicate_students[['Duplicate Group', 'First Name', 'Last Name', 'Phone N°', 'E-mail', 'DATE', 'Stage', 'Agent']], use_container_width=True)
     else:
         st.write("No duplicate students found.")
 
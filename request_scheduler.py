@@ -0,0 +1,180 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import streamlit as st
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Priority lanes: waiting interactive requests are always sent before background ones
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Requests per minute per bucket. Sheets allows 60 reads and 60 writes per minute per
+# user, and the service account is a single user; Drive allows far more, so its bucket
+# only smooths bursts of uploads and folder lookups.
+QUOTAS_PER_MINUTE = {
+    'sheets_read': 60,
+    'sheets_write': 60,
+    'drive': 1000,
+}
+
+# A bucket holds this many seconds' worth of requests, so a page can burst
+BURST_SECONDS = 10
+
+# Share of each bucket background requests leave for interactive ones
+BACKGROUND_RESERVE = 0.25
+
+# Only these are worth retrying; anything else (404, 400, bad credentials) fails at once
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+MAX_ATTEMPTS = 5
+BASE_RETRY_DELAY_SECONDS = 1
+MAX_RETRY_DELAY_SECONDS = 32
+
+_lane = threading.local()
+
+
+def current_lane():
+    return getattr(_lane, 'value', INTERACTIVE)
+
+
+# Context manager for worker threads: requests made inside it go through the background lane
+@contextmanager
+def request_lane(lane):
+    previous = current_lane()
+    _lane.value = lane
+    try:
+        yield
+    finally:
+        _lane.value = previous
+
+
+# Function to turn a Retry-After header (seconds or an HTTP date) into seconds
+def retry_after_seconds(value):
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+# Function to compute the delay before retry number `attempt` (0-based): exponential with
+# equal jitter, so callers that failed together do not retry together, and never shorter
+# than the server's Retry-After
+def backoff_delay(attempt, retry_after=0.0):
+    ceiling = min(MAX_RETRY_DELAY_SECONDS, BASE_RETRY_DELAY_SECONDS * 2 ** attempt)
+    return max(retry_after, ceiling / 2 + random.uniform(0, ceiling / 2))
+
+
+class TokenBucket:
+    """Token bucket for one per-minute quota.
+
+    The bucket holds BURST_SECONDS of requests and refills at the rate that
+    leaves room for that burst, so no 60-second window can exceed the quota.
+    """
+
+    def __init__(self, per_minute, burst_seconds=BURST_SECONDS):
+        self.capacity = max(1.0, per_minute * burst_seconds / 60)
+        self.rate = max(per_minute - self.capacity, 1.0) / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now, lane):
+        # Seconds until a request in `lane` may be sent; 0 if it may go now
+        floor = self.capacity * BACKGROUND_RESERVE if lane == BACKGROUND else 0.0
+        missing = floor + 1 - self.tokens
+        return max(self.paused_until - now, missing / self.rate if missing > 0 else 0.0, 0.0)
+
+
+class RequestScheduler:
+    """Admits every Sheets and Drive request of the process.
+
+    Each request takes a token from its API's bucket, waiting in priority
+    order (interactive before background, then first come first served).
+    429 and 5xx answers are retried with jittered backoff; a 429 pauses the
+    whole bucket for its Retry-After, since every other caller would hit the
+    same quota.
+    """
+
+    def __init__(self, quotas=QUOTAS_PER_MINUTE):
+        self.buckets = {name: TokenBucket(per_minute) for name, per_minute in quotas.items()}
+        self._waiting = {name: [] for name in quotas}
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self.throttled = 0
+        self.retried = 0
+
+    def acquire(self, name, lane=None):
+        lane = current_lane() if lane is None else lane
+        bucket = self.buckets[name]
+        waiting = self._waiting[name]
+        ticket = (lane, next(self._order))
+        with self._cond:
+            heapq.heappush(waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    bucket.refill(now)
+                    delay = bucket.wait_time(now, lane)
+                    if waiting[0] != ticket:
+                        # Woken again when the request ahead is admitted
+                        self._cond.wait()
+                    elif delay > 0:
+                        self._cond.wait(delay)
+                    else:
+                        bucket.tokens -= 1
+                        return
+            finally:
+                waiting.remove(ticket)
+                heapq.heapify(waiting)
+                self._cond.notify_all()
+
+    def pause(self, name, seconds):
+        with self._cond:
+            bucket = self.buckets[name]
+            bucket.paused_until = max(bucket.paused_until, time.monotonic() + seconds)
+            bucket.tokens = min(bucket.tokens, 0.0)
+            self._cond.notify_all()
+
+    def execute(self, name, send, status_of):
+        # `send` performs the request; `status_of(response)` returns (status, Retry-After header)
+        for attempt in range(MAX_ATTEMPTS):
+            self.acquire(name)
+            response = send()
+            status, retry_after = status_of(response)
+            if status not in RETRYABLE_STATUSES or attempt == MAX_ATTEMPTS - 1:
+                return response
+            delay = backoff_delay(attempt, retry_after_seconds(retry_after))
+            self.retried += 1
+            if status == 429:
+                self.throttled += 1
+                logger.warning(f"{name} quota exceeded, pausing {name} requests for {delay:.1f}s")
+                self.pause(name, delay)
+            else:
+                logger.warning(f"{name} request failed with {status}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+        return response
+
+
+# One scheduler per server process, shared by the Sheets and Drive clients
+@st.cache_resource
+def get_request_scheduler():
+    return RequestScheduler()
@@ -0,0 +1,619 @@
+import os
+import threading
+import uuid
+from datetime import date, datetime
+import time
+import logging
+import gspread
+import pandas as pd
+import streamlit as st
+from google_clients import get_google_sheet_client
+from request_scheduler import BACKGROUND, request_lane
+from sheet_diff import FrameDiff, build_requests
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SPREADSHEET_ID = "1os1G3ri4xMmJdQSNsVSNx6VJttyM8JsPNbmH0DCFUiI"
+ROSTER_SHEET = "ALL"
+
+# Headers of the "ALL" worksheet, used to validate the sheet when loading it
+ROSTER_HEADERS = [
+    'DATE', 'First Name', 'Last Name', 'Age', 'Phone N°', 'Address', 'E-mail', 'Payment Type', 'Compte', 'Student Name', 'Months',
+    'Emergency contact N°', 'Chosen School', 'Specialite', 'Duration',
+    'Payment Amount', 'Sevis payment ?', 'Application payment ?', 'DS-160 maker',
+    'Password DS-160', 'Secret Q.', 'School Entry Date', 'Entry Date in the US',
+    'ADDRESS in the U.S', 'E-MAIL RDV', 'PASSWORD RDV', 'EMBASSY ITW. DATE',
+    'Attempts', 'Visa Result', 'Agent', 'Note', 'Stage', 'Gender', 'BANK', 'Prep ITW', 'School Paid'
+]
+
+# How long a loaded roster is served before the next session triggers a refresh
+REFRESH_INTERVAL_SECONDS = 60
+
+# How often a refresh re-reads every row to pick up edits made outside this process
+FULL_SYNC_INTERVAL_SECONDS = 300
+
+# Number of versions for which changed row positions are remembered
+CHANGE_LOG_SIZE = 50
+
+# Last good roster kept on disk, so a cold start renders without waiting for Google Sheets
+SNAPSHOT_PATH = os.environ.get('ROSTER_SNAPSHOT_PATH', os.path.join('.cache', 'roster.parquet'))
+
+# Column holding the stable ID of each student; created on first load if the sheet lacks it
+STUDENT_ID_COLUMN = 'Student ID'
+
+# Resyncs tried before a write is postponed because rows keep moving under it
+RESOLVE_ATTEMPTS = 3
+
+# Date columns are parsed once when the typed roster is built, and written back in the sheet's own format
+DATE_COLUMNS = ['DATE', 'School Entry Date', 'Entry Date in the US', 'EMBASSY ITW. DATE']
+SHEET_DATE_FORMAT = '%d/%m/%Y %H:%M:%S'
+
+# Low-cardinality columns kept as categoricals in the typed roster
+CATEGORY_COLUMNS = [
+    'Stage', 'Agent', 'Chosen School', 'Payment Type', 'Payment Amount', 'Attempts', 'Visa Result',
+    'Gender', 'Compte', 'Sevis payment ?', 'Application payment ?', 'School Paid', 'Prep ITW', 'Months'
+]
+
+
+class RosterStore:
+    """Process-wide copy of the "ALL" worksheet shared by every page and session.
+
+    The roster is downloaded once and then kept up to date incrementally:
+    each refresh interval only the rows appended below the last known row are
+    fetched, and a full pass every `full_sync_interval` re-hashes every row to
+    pick up edits made elsewhere, patching just the rows that differ. Every
+    change bumps `version` and is recorded so callers can ask which rows
+    changed since the version they hold.
+
+    Every row carries a persistent Student ID; the store keeps a hash index
+    from ID to row position.
+
+    The last good roster is saved to a Parquet snapshot. A cold process serves
+    the snapshot at once, and a stale roster is served while a background
+    thread refreshes it, so only the very first load ever waits on the network.
+    """
+
+    def __init__(self, spreadsheet_id, sheet_name, refresh_interval=REFRESH_INTERVAL_SECONDS,
+                 full_sync_interval=FULL_SYNC_INTERVAL_SECONDS, snapshot_path=SNAPSHOT_PATH):
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_name = sheet_name
+        self.snapshot_path = snapshot_path
+        self.refresh_interval = refresh_interval
+        self.full_sync_interval = full_sync_interval
+        self.version = 0
+        self.loaded_at = None
+        self.full_synced_at = None
+        self.header = None
+        self._data = None
+        self._row_hashes = []
+        self._changes = []
+        self._worksheet = None
+        self._id_index = {}
+        self._typed = None
+        self._typed_version = None
+        self._snapshot_version = None
+        self._refreshing = False
+        self._refresh_flag_lock = threading.Lock()
+        # One download at a time; held for the network I/O of a sync
+        self._sync_lock = threading.Lock()
+        # Guards the frame, hashes and indexes; only held to swap or patch them, never across a request
+        self._lock = threading.Lock()
+
+    def worksheet(self):
+        # Opening a worksheet costs a metadata request, so keep the handle
+        if self._worksheet is None:
+            client = get_google_sheet_client()
+            self._worksheet = client.open_by_key(self.spreadsheet_id).worksheet(self.sheet_name)
+        return self._worksheet
+
+    def _pad(self, row, header=None):
+        width = len(header or self.header)
+        return list(row[:width]) + [''] * (width - len(row))
+
+    def _to_frame(self, rows):
+        return pd.DataFrame([self._pad(row) for row in rows], columns=self.header)
+
+    def _fetch_all(self, worksheet):
+        # (header, rows) of the whole worksheet
+        values = worksheet.get_all_values(value_render_option='FORMATTED_VALUE')
+        header = values[0] if values else []
+        missing = [col for col in ROSTER_HEADERS if col not in header]
+        if missing:
+            raise ValueError(f"Worksheet '{self.sheet_name}' is missing columns: {missing}")
+        return header, values[1:]
+
+    def _end_column(self):
+        return gspread.utils.rowcol_to_a1(1, len(self.header))[:-1]
+
+    def _fetch_tail(self, worksheet, start):
+        # An open-ended range stops at the last non-empty row, so this returns
+        # only the rows below the first `start` rows (usually none)
+        return worksheet.get(f"A{start + 2}:{self._end_column()}", value_render_option='FORMATTED_VALUE')
+
+    def _ensure_id_column(self, worksheet, header):
+        if STUDENT_ID_COLUMN not in header:
+            # Writing past the last column of the grid is rejected, so make room first
+            if len(header) >= worksheet.col_count:
+                worksheet.add_cols(1)
+            worksheet.update_cell(1, len(header) + 1, STUDENT_ID_COLUMN)
+            header = header + [STUDENT_ID_COLUMN]
+            logger.info(f"Added '{STUDENT_ID_COLUMN}' column to worksheet '{self.sheet_name}'")
+        return header
+
+    def _assign_ids(self, worksheet, rows, known_ids, header=None):
+        # Give an ID to every non-empty row that has none, or a copy of an ID already
+        # seen at another position in the same fetch, and write the new IDs back in one
+        # request; rows maps position -> padded values
+        id_col = (header or self.header).index(STUDENT_ID_COLUMN)
+        seen = dict(known_ids)
+        updates = []
+        for row_position, row in sorted(rows.items()):
+            student_id = row[id_col]
+            if not student_id or seen.get(student_id, row_position) != row_position:
+                if not any(row):
+                    continue
+                student_id = new_student_id()
+                row[id_col] = student_id
+                updates.append({'range': gspread.utils.rowcol_to_a1(row_position + 2, id_col + 1), 'values': [[student_id]]})
+            seen[student_id] = row_position
+        if updates:
+            try:
+                worksheet.batch_update(updates, value_input_option='RAW')
+                logger.info(f"Assigned {len(updates)} new student IDs")
+            except Exception as e:
+                # Keep the IDs in memory; they are written again on the next full sync
+                logger.error(f"Could not write student IDs: {str(e)}")
+
+    def _rebuild_index(self):
+        ids = self._data[STUDENT_ID_COLUMN].tolist()
+        self._id_index = {student_id: i for i, student_id in enumerate(ids) if student_id}
+
+    def _record_change(self, rows):
+        # rows is a set of row positions, or None when every row may have changed
+        self.version += 1
+        self._changes.append((self.version, rows))
+        del self._changes[:-CHANGE_LOG_SIZE]
+
+    def _full_sync(self, worksheet):
+        # Requests are made without holding _lock; it is only taken to swap in the result
+        header, fetched = self._fetch_all(worksheet)
+        header = self._ensure_id_column(worksheet, header)
+        rows = [self._pad(row, header) for row in fetched]
+        self._assign_ids(worksheet, dict(enumerate(rows)), {}, header)
+        hashes = [hash(tuple(row)) for row in rows]
+        with self._lock:
+            if self._data is None or len(hashes) < len(self._row_hashes) or list(self._data.columns) != header:
+                # First load, or rows were deleted: positions shifted, so replace everything
+                self.header = header
+                self._data = self._to_frame(rows)
+                self._row_hashes = hashes
+                self._rebuild_index()
+                self._record_change(None)
+                return
+            changed = {i for i, h in enumerate(hashes) if i >= len(self._row_hashes) or self._row_hashes[i] != h}
+            if changed:
+                self._patch_rows({i: rows[i] for i in changed})
+
+    def _tail_sync(self, worksheet):
+        # Returns False when a known student shows up below the rows we have: a row was
+        # inserted higher up and positions shifted, so only a full sync can place them
+        start = len(self._row_hashes)
+        fetched = self._fetch_tail(worksheet, start)
+        if fetched:
+            rows = {start + i: self._pad(row) for i, row in enumerate(fetched)}
+            id_col = self.header.index(STUDENT_ID_COLUMN)
+            if any(row[id_col] in self._id_index for row in rows.values()):
+                logger.info("Roster rows shifted since the last sync; doing a full sync")
+                return False
+            self._assign_ids(worksheet, rows, dict(self._id_index))
+            with self._lock:
+                self._patch_rows(rows)
+        return True
+
+    def _patch_rows(self, rows):
+        # Copy on write so sessions reading the previous frame are unaffected
+        patch = self._to_frame(list(rows.values()))
+        patch.index = list(rows.keys())
+        data = self._data.copy()
+        existing = [i for i in rows if i < len(data)]
+        if existing:
+            data.loc[existing] = patch.loc[existing].values
+        appended = patch.loc[[i for i in rows if i >= len(data)]]
+        if not appended.empty:
+            data = pd.concat([data, appended.sort_index()])
+        self._data = data
+        self._rebuild_index()
+        for i, row in rows.items():
+            row_hash = hash(tuple(self._pad(row)))
+            if i < len(self._row_hashes):
+                self._row_hashes[i] = row_hash
+            else:
+                self._row_hashes.append(row_hash)
+        self._record_change(set(rows))
+
+    def _load_snapshot(self):
+        try:
+            data = pd.read_parquet(self.snapshot_path)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"Could not read roster snapshot {self.snapshot_path}: {str(e)}")
+            return False
+        data = data.reset_index(drop=True)
+        with self._lock:
+            self.header = list(data.columns)
+            self._data = data
+            self._row_hashes = [hash(row) for row in data.itertuples(index=False, name=None)]
+            self._rebuild_index()
+            self._record_change(None)
+        self._snapshot_version = self.version
+        # Served immediately, but stale: the first refresh does a full sync
+        self.loaded_at = float('-inf')
+        self.full_synced_at = float('-inf')
+        logger.info(f"Roster loaded from snapshot ({len(self._data)} rows)")
+        return True
+
+    def _save_snapshot(self):
+        # Frames are replaced, never modified, so the one read here stays consistent
+        with self._lock:
+            version, data = self.version, self._data
+        if self._snapshot_version == version:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path) or '.', exist_ok=True)
+            tmp_path = self.snapshot_path + '.tmp'
+            data.to_parquet(tmp_path, index=False)
+            # Replace atomically so a crash never leaves a half-written snapshot
+            os.replace(tmp_path, self.snapshot_path)
+            self._snapshot_version = version
+        except Exception as e:
+            logger.warning(f"Could not write roster snapshot {self.snapshot_path}: {str(e)}")
+
+    def _refresh_in_background(self):
+        # Separate lock: callers must not wait behind a sync that is already running
+        with self._refresh_flag_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                with request_lane(BACKGROUND):
+                    self.get(wait=True)
+            except Exception as e:
+                logger.error(f"Background roster refresh failed: {str(e)}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, name="roster-refresh", daemon=True).start()
+
+    def _is_fresh(self):
+        return self._data is not None and time.monotonic() - self.loaded_at < self.refresh_interval
+
+    def get(self, force=False, wait=False):
+        # Fast path: no lock needed to read a fresh snapshot
+        if not force and self._is_fresh():
+            return self.version, self._data
+
+        # Stale but present: serve it and refresh without blocking the caller
+        if not force and not wait and self._data is not None:
+            self._refresh_in_background()
+            return self.version, self._data
+
+        with self._sync_lock:
+            # Another session may have refreshed while we waited for the lock
+            if not force and self._is_fresh():
+                return self.version, self._data
+            from_snapshot = not force and self._data is None and self._load_snapshot()
+            if not from_snapshot:
+                self._sync(force)
+                return self.version, self._data
+
+        self._refresh_in_background()
+        return self.version, self._data
+
+    def _sync(self, force):
+        try:
+            worksheet = self.worksheet()
+            now = time.monotonic()
+            if (force or self._data is None or now - self.full_synced_at >= self.full_sync_interval
+                    or not self._tail_sync(worksheet)):
+                self._full_sync(worksheet)
+                self.full_synced_at = now
+        except Exception as e:
+            if self._data is None:
+                raise
+            logger.error(f"Roster refresh failed, serving version {self.version}: {str(e)}")
+            # Wait a full interval before trying again rather than retrying on every rerun
+            self.loaded_at = time.monotonic()
+            return
+        self.loaded_at = time.monotonic()
+        self._save_snapshot()
+        logger.info(f"Roster version {self.version} ({len(self._data)} rows)")
+
+    def apply_local_update(self, row_position, updates):
+        self.apply_local_updates({row_position: updates})
+
+    def apply_local_updates(self, updates_by_row):
+        # Patch rows we just wrote ourselves, so nobody has to download the sheet to see them
+        with self._lock:
+            if self._data is None or not updates_by_row:
+                return
+            rows = {}
+            for row_position, updates in updates_by_row.items():
+                if row_position < len(self._data):
+                    row = self._data.loc[row_position].tolist()
+                else:
+                    row = [''] * len(self.header)
+                for col, value in updates.items():
+                    if col in self.header:
+                        row[self.header.index(col)] = '' if value is None else str(value)
+                rows[row_position] = row
+            self._patch_rows(rows)
+
+    def record_append(self, row_position, row):
+        # A row we just appended ourselves. It is patched in if it directly follows the
+        # known rows; otherwise others appended too, and the next read fetches the tail.
+        with self._lock:
+            if self._data is not None and row_position == len(self._data):
+                self._patch_rows({row_position: self._pad(row)})
+            else:
+                self.loaded_at = float('-inf')
+
+    def refresh_students(self, student_ids):
+        # Re-read just these students' rows from the sheet and patch the ones that changed.
+        # Rows are read at their cached positions; if one comes back holding another
+        # Student ID, rows have moved, so the whole roster is resynced instead.
+        expected = {self._id_index[sid]: sid for sid in student_ids if sid in self._id_index}
+        if self._data is None or not expected:
+            return
+        positions = sorted(expected)
+        end_col = self._end_column()
+        id_col = self.header.index(STUDENT_ID_COLUMN)
+        ranges = [f"A{p + 2}:{end_col}{p + 2}" for p in positions]
+        values = self.worksheet().batch_get(ranges, value_render_option='FORMATTED_VALUE')
+        rows = {p: self._pad(v[0] if v else []) for p, v in zip(positions, values)}
+        if any(row[id_col] != expected[p] for p, row in rows.items()):
+            logger.warning("Roster rows moved since the last sync; resyncing")
+            self.get(force=True)
+            return
+        with self._lock:
+            # Skip rows that moved locally while we were reading
+            changed = {p: row for p, row in rows.items()
+                       if self._id_index.get(expected[p]) == p and hash(tuple(row)) != self._row_hashes[p]}
+            if changed:
+                self._patch_rows(changed)
+
+    def read_ids(self, row_positions):
+        # Student IDs the sheet holds right now at these row positions, read in one request
+        id_col = gspread.utils.rowcol_to_a1(1, self.header.index(STUDENT_ID_COLUMN) + 1)[:-1]
+        values = self.worksheet().batch_get([f"{id_col}{p + 2}" for p in row_positions],
+                                            value_render_option='FORMATTED_VALUE')
+        return [v[0][0] if v and v[0] else '' for v in values]
+
+    def row_count(self):
+        return len(self._row_hashes)
+
+    def position_of(self, student_id):
+        # Current row position of a student, or None if the ID is unknown
+        return self._id_index.get(student_id)
+
+    def fingerprint(self, student_id):
+        # Hash of the student's row as last read; it changes whenever any cell of the row does
+        position = self._id_index.get(student_id)
+        return None if position is None else self._row_hashes[position]
+
+    def row_record(self, student_id):
+        # The student's row as {column: text}, or None if the ID is unknown
+        position = self._id_index.get(student_id)
+        return None if position is None else dict(zip(self.header, self._data.loc[position].tolist()))
+
+    def changed_rows_since(self, version):
+        # Row positions changed after `version`, or None if that is unknown (too old, or a full reload)
+        if version == self.version:
+            return set()
+        changes = [rows for v, rows in self._changes if v > version]
+        if len(changes) < self.version - version or any(rows is None for rows in changes):
+            return None
+        return set().union(*changes)
+
+    def typed_snapshot(self, force=False):
+        # (version, typed view of the roster), built once per version and shared by every session
+        version, data = self.get(force=force)
+        typed = self._typed
+        if typed is None or self._typed_version != version:
+            typed = to_typed_frame(data)
+            self._typed, self._typed_version = typed, version
+        return version, typed
+
+    def typed(self, force=False):
+        return self.typed_snapshot(force=force)[1]
+
+
+@st.cache_resource
+def get_roster_store():
+    return RosterStore(SPREADSHEET_ID, ROSTER_SHEET)
+
+
+# Function to parse a date column; the sheet format first, then any day-first date
+def parse_dates(values):
+    parsed = pd.to_datetime(values, format=SHEET_DATE_FORMAT, errors='coerce')
+    retry = parsed.isna() & (values.str.strip() != '')
+    if retry.any():
+        parsed[retry] = pd.to_datetime(values[retry], dayfirst=True, errors='coerce')
+    return parsed
+
+
+# Function to build the typed roster: dates as datetime64, low-cardinality columns as categoricals
+def to_typed_frame(data):
+    typed = data.copy()
+    for col in DATE_COLUMNS:
+        if col in typed.columns:
+            typed[col] = parse_dates(typed[col])
+    for col in CATEGORY_COLUMNS:
+        if col in typed.columns:
+            typed[col] = typed[col].astype('category')
+    return typed
+
+
+# Function to load the shared typed roster; returns a private copy the caller may modify
+def load_roster(force=False):
+    return get_roster_store().typed(force=force).copy()
+
+
+# Function to load the roster rows that are students; blank sheet rows have no Student ID
+# and cannot be indexed by it
+def load_students(force=False):
+    data = load_roster(force=force)
+    return data[data[STUDENT_ID_COLUMN].fillna('') != '']
+
+
+def get_roster_version():
+    return get_roster_store().version
+
+
+# Function to convert a form value to the text stored in the sheet
+def format_cell(col, value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ''
+    if col in DATE_COLUMNS and isinstance(value, (date, datetime)):
+        return value.strftime(SHEET_DATE_FORMAT)
+    return str(value)
+
+
+# Function to tell a day from a date-only widget apart from a datetime (a datetime is also a date)
+def _is_day(value):
+    return isinstance(value, date) and not isinstance(value, datetime)
+
+
+# Function to read a date cell as a Timestamp; NaT if it is empty or not a date
+def _parse_date(col, value):
+    return pd.to_datetime(format_cell(col, value), errors='coerce', dayfirst=True)
+
+
+# Function to compare two values of a column as the sheet stores them; dates are compared as
+# dates, and at day granularity when one side comes from a date-only widget
+def same_value(col, a, b):
+    if col in DATE_COLUMNS and (_is_day(a) or _is_day(b)):
+        a_date, b_date = _parse_date(col, a), _parse_date(col, b)
+        if pd.isna(a_date) or pd.isna(b_date):
+            return pd.isna(a_date) and pd.isna(b_date)
+        return a_date.date() == b_date.date()
+    a, b = format_cell(col, a), format_cell(col, b)
+    if a == b:
+        return True
+    if col in DATE_COLUMNS:
+        a_date = pd.to_datetime(a, errors='coerce', dayfirst=True)
+        b_date = pd.to_datetime(b, errors='coerce', dayfirst=True)
+        return not pd.isna(a_date) and a_date == b_date
+    return False
+
+
+# Function to put a day picked in a date-only widget at the time of day the cell already had
+def _keep_time(col, original, value):
+    if col not in DATE_COLUMNS or not _is_day(value):
+        return value
+    before = _parse_date(col, original)
+    return datetime.combine(value, before.time() if not pd.isna(before) else datetime.min.time())
+
+
+# Function to compare an edited record with the loaded one; returns only the changed cells
+def diff_record(original, updated):
+    return {col: format_cell(col, _keep_time(col, original.get(col), value)) for col, value in updated.items()
+            if not same_value(col, original.get(col), value)}
+
+
+# Function to find the fields someone else changed while we were editing. `base` holds
+# the values our edit started from, `current` the values now; returns
+# {column: (their value, our value)} for each of our changes that would overwrite theirs.
+# Changes to different fields are not conflicts: only our changed cells are written.
+def find_conflicts(current, base, changes):
+    conflicts = {}
+    for col, value in changes.items():
+        theirs = current.get(col, '')
+        if not same_value(col, theirs, base.get(col)) and not same_value(col, theirs, value):
+            conflicts[col] = (format_cell(col, theirs), value)
+    return conflicts
+
+
+# Function to create a new student ID
+def new_student_id():
+    return uuid.uuid4().hex[:12]
+
+
+# Function to find the current row position of a student; raises KeyError if unknown
+def find_student_row(student_id):
+    row_position = get_roster_store().position_of(student_id)
+    if row_position is None:
+        raise KeyError(f"Student ID '{student_id}' not found in the roster")
+    return row_position
+
+
+# Function to resolve Student IDs to the rows they occupy in the sheet right now. Cached
+# positions can be minutes old, so the ID column is read back at each of them; if any
+# student has moved (rows inserted or deleted elsewhere) the roster is fully resynced
+# and the IDs resolved again. Raises KeyError for an ID that is no longer in the sheet.
+def resolve_student_rows(student_ids):
+    store = get_roster_store()
+    student_ids = list(dict.fromkeys(student_ids))
+    for _ in range(RESOLVE_ATTEMPTS):
+        positions = [find_student_row(student_id) for student_id in student_ids]
+        if not positions or store.read_ids(positions) == student_ids:
+            return dict(zip(student_ids, positions))
+        logger.warning("Roster rows moved since the last sync; resyncing before writing")
+        store.get(force=True)
+    raise RuntimeError("Roster rows kept moving while resolving student IDs; write postponed")
+
+
+# Function to re-read one student's row without touching the rest of the roster
+def refresh_student(student_id):
+    get_roster_store().refresh_students([student_id])
+
+
+# Function to append a new student in a single request. The row is written in the
+# sheet's column order with its Student ID (a new one unless the record has one);
+# returns (student ID, sheet row it landed on).
+def append_student(record):
+    store = get_roster_store()
+    store.get()
+    student_id = record.get(STUDENT_ID_COLUMN) or new_student_id()
+    values = dict(record, **{STUDENT_ID_COLUMN: student_id})
+    row = [format_cell(col, values.get(col)) for col in store.header]
+    response = store.worksheet().append_row(row, value_input_option='RAW',
+                                            insert_data_option='INSERT_ROWS', table_range='A1')
+    # updatedRange looks like "'ALL'!A124:AK124"
+    first_cell = response['updates']['updatedRange'].split('!')[-1].split(':')[0]
+    sheet_row, _ = gspread.utils.a1_to_rowcol(first_cell)
+    store.record_append(sheet_row - 2, row)
+    logger.info(f"Student {student_id} appended at row {sheet_row}")
+    return student_id, sheet_row
+
+
+# Function to push a FrameDiff keyed by student ID (changed cells, new rows,
+# deleted rows) in a single request
+def write_frame_diff(diff):
+    if not diff:
+        return
+    store = get_roster_store()
+    worksheet = store.worksheet()
+
+    # Resolve IDs to the rows they occupy now, and give new rows their IDs up front
+    rows = resolve_student_rows([student_id for student_id, _ in diff.cells] + list(diff.deleted))
+    diff = FrameDiff(
+        cells={(rows[student_id], col): value for (student_id, col), value in diff.cells.items()},
+        appended=[dict(values, **{STUDENT_ID_COLUMN: new_student_id()}) for values in diff.appended],
+        deleted=[rows[student_id] for student_id in diff.deleted],
+    )
+    worksheet.spreadsheet.batch_update({'requests': build_requests(diff, worksheet.id, store.header)})
+
+    if diff.deleted:
+        # Deleting rows shifts every position below them, so resync
+        store.get(force=True)
+        return
+    updates = diff.rows_changed()
+    first_new_row = store.row_count()
+    for i, values in enumerate(diff.appended):
+        updates[first_new_row + i] = values
+    store.apply_local_updates(updates)
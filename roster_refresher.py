@@ -0,0 +1,66 @@
+import threading
+import time
+import logging
+import streamlit as st
+from streamlit_server_state import server_state, server_state_lock
+from roster import get_roster_store
+from request_scheduler import BACKGROUND, request_lane
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# How often the worker checks the store; the sheet itself is only polled once per refresh interval
+POLL_INTERVAL_SECONDS = 2
+
+# Server-state key holding the latest published roster version
+VERSION_KEY = "roster_version"
+
+
+class RosterRefresher(threading.Thread):
+    """Keeps the shared roster fresh and tells open sessions about new versions.
+
+    Each new version, whether it came from the sheet or from a save in this
+    process, is published to server state, which reruns every session that
+    is watching the roster.
+    """
+
+    def __init__(self, store, poll_interval=POLL_INTERVAL_SECONDS):
+        super().__init__(name="roster-refresher", daemon=True)
+        self.store = store
+        self.poll_interval = poll_interval
+        self.published_version = None
+
+    def run(self):
+        with request_lane(BACKGROUND):
+            self._poll()
+
+    def _poll(self):
+        while True:
+            try:
+                version, _ = self.store.get(wait=True)
+                if version != self.published_version:
+                    with server_state_lock[VERSION_KEY]:
+                        server_state[VERSION_KEY] = version
+                    self.published_version = version
+            except Exception as e:
+                logger.error(f"Roster refresher failed: {str(e)}")
+            time.sleep(self.poll_interval)
+
+
+# One refresher per server process
+@st.cache_resource
+def start_roster_refresher():
+    refresher = RosterRefresher(get_roster_store())
+    refresher.start()
+    return refresher
+
+
+# Function for pages that should follow roster changes made by other agents.
+# Reading the key subscribes this session, so it is rerun whenever a new version is published.
+def watch_roster():
+    start_roster_refresher()
+    with server_state_lock[VERSION_KEY]:
+        if VERSION_KEY in server_state:
+            return server_state[VERSION_KEY]
+    return None
@@ -0,0 +1,97 @@
+import pandas as pd
+
+
+# Function to normalise a cell to the text shown in the editor
+def _cell_text(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ''
+    text = str(value)
+    return '' if text in ('nan', 'NaN', 'None', 'NaT') else text
+
+
+class FrameDiff:
+    """Changes between a loaded roster frame and its edited copy.
+
+    `cells` maps (row position, column) to the new text, `appended` holds
+    column -> text dicts for new rows and `deleted` lists removed row positions.
+    `base` maps the same keys as `cells` to the text the edit started from.
+    """
+
+    def __init__(self, cells=None, appended=None, deleted=None, base=None):
+        self.cells = cells or {}
+        self.appended = appended or []
+        self.deleted = deleted or []
+        self.base = base or {}
+
+    def __bool__(self):
+        return bool(self.cells or self.appended or self.deleted)
+
+    def rows_changed(self):
+        rows = {}
+        for (row_position, col), value in self.cells.items():
+            rows.setdefault(row_position, {})[col] = value
+        return rows
+
+
+# Function to diff an edited frame against the original one.
+# `shown_index` is the index of the rows that were displayed, so rows hidden by
+# filters are not mistaken for deletions; `columns` are the columns to compare.
+def diff_frames(original, edited, shown_index, columns):
+    cells = {}
+    base = {}
+    appended = []
+    original_index = set(original.index)
+
+    for idx, row in edited.iterrows():
+        if pd.isna(idx) or idx not in original_index:
+            values = {col: _cell_text(row.get(col)) for col in edited.columns}
+            if any(values.values()):
+                appended.append(values)
+            continue
+        for col in columns:
+            if col not in edited.columns:
+                continue
+            new = _cell_text(row[col])
+            old = _cell_text(original.at[idx, col])
+            if new != old:
+                cells[(idx, col)] = new
+                base[(idx, col)] = old
+
+    edited_index = set(edited.index)
+    deleted = sorted(idx for idx in shown_index if idx not in edited_index)
+    return FrameDiff(cells, appended, deleted, base)
+
+
+def _cell_data(value):
+    return {'userEnteredValue': {'stringValue': value}}
+
+
+# Function to turn a diff into spreadsheets.batchUpdate requests for one worksheet.
+# Cell updates come first, then appends, then deletions from the bottom up so
+# earlier requests still address the rows they were computed for.
+def build_requests(diff, sheet_id, header):
+    requests = []
+    for (row_position, col), value in sorted(diff.cells.items()):
+        requests.append({
+            'updateCells': {
+                'start': {'sheetId': sheet_id, 'rowIndex': row_position + 1, 'columnIndex': header.index(col)},
+                'rows': [{'values': [_cell_data(value)]}],
+                'fields': 'userEnteredValue',
+            }
+        })
+    if diff.appended:
+        requests.append({
+            'appendCells': {
+                'sheetId': sheet_id,
+                'rows': [{'values': [_cell_data(values.get(col, '')) for col in header]} for values in diff.appended],
+                'fields': 'userEnteredValue',
+            }
+        })
+    for row_position in sorted(diff.deleted, reverse=True):
+        requests.append({
+            'deleteDimension': {
+                'range': {'sheetId': sheet_id, 'dimension': 'ROWS',
+                          'startIndex': row_position + 1, 'endIndex': row_position + 2}
+            }
+        })
+    return requests
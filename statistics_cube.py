@@ -0,0 +1,127 @@
+import threading
+import logging
+import pandas as pd
+import streamlit as st
+from dedup import deduplicate
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Dimensions the Statistics page breaks students down by
+CUBE_DIMENSIONS = ['Chosen School', 'Agent', 'Stage', 'Payment Type', 'Payment Amount', 'Visa Result', 'Gender', 'Attempts']
+
+DECIDED_RESULTS = ['Visa Approved', 'Visa Denied']
+
+MEASURES = ['Students', 'Approved', 'Decided']
+
+
+def approval_rate(approved, decided):
+    return approved / decided * 100 if decided > 0 else 0
+
+
+class CubeSlice:
+    """The cube restricted to a date range; every method is a small groupby over cube cells."""
+
+    def __init__(self, totals, cells):
+        self.totals = totals
+        self.cells = cells
+
+    def summary(self):
+        # (students, visa approvals, visa decisions)
+        students, approved, decided = (int(self.totals[m].sum()) for m in MEASURES)
+        return students, approved, decided
+
+    def by(self, dim):
+        # Students, Approved and Decided per value of `dim`, values with no students left out
+        grouped = self.cells[dim].groupby(level='Value', observed=True).sum()
+        return grouped[grouped['Students'] > 0]
+
+    def counts(self, dim):
+        # Same result as value_counts() on the raw rows
+        return self.by(dim)['Students'].sort_values(ascending=False, kind='stable')
+
+    def approval_rates(self, dim):
+        grouped = self.by(dim)
+        rates = (grouped['Approved'] / grouped['Decided'] * 100).where(grouped['Decided'] > 0, 0)
+        return rates.rename('Approval Rate')
+
+    def monthly(self, dim=None, values=None):
+        # Students per calendar month, optionally only rows whose `dim` is in `values`
+        if dim is None:
+            students = self.totals['Students']
+        else:
+            cells = self.cells[dim]
+            cells = cells[cells.index.get_level_values('Value').isin(values)]
+            students = cells['Students'].groupby(level='Day').sum()
+        monthly = students.groupby(students.index.to_period('M')).sum()
+        return monthly[monthly > 0]
+
+
+class StatisticsCube:
+    """Student counts of one roster version pre-aggregated per day.
+
+    `totals` holds the measures per day and `cells[dim]` per (day, value) for
+    each dimension. A joint cube over every dimension would have about as many
+    cells as the roster has rows, so each chart gets its own rollup instead.
+    """
+
+    def __init__(self, data):
+        visa = data['Visa Result'].astype(str)
+        measures = pd.DataFrame({
+            'Day': data['DATE'].dt.normalize(),
+            'Students': 1,
+            'Approved': (visa == 'Visa Approved').astype(int),
+            'Decided': visa.isin(DECIDED_RESULTS).astype(int),
+        }, index=data.index)
+        self.totals = measures.groupby('Day').sum()
+        self.cells = {}
+        for dim in CUBE_DIMENSIONS:
+            cells = measures.assign(Value=data[dim]).groupby(['Day', 'Value'], observed=True).sum()
+            self.cells[dim] = cells
+        self._cell_days = {dim: cells.index.get_level_values('Day') for dim, cells in self.cells.items()}
+
+    @property
+    def min_date(self):
+        return self.totals.index.min()
+
+    @property
+    def max_date(self):
+        return self.totals.index.max()
+
+    def slice(self, start=None, end=None):
+        # Rows whose DATE falls on a day from start to end, both included
+        start = pd.Timestamp(start).normalize() if start is not None else self.min_date
+        end = pd.Timestamp(end).normalize() if end is not None else self.max_date
+        totals = self.totals[(self.totals.index >= start) & (self.totals.index <= end)]
+        cells = {dim: frame[(self._cell_days[dim] >= start) & (self._cell_days[dim] <= end)]
+                 for dim, frame in self.cells.items()}
+        return CubeSlice(totals, cells)
+
+
+class StatisticsCubeCache:
+    """The cube for the roster's current version, shared by every session."""
+
+    def __init__(self):
+        self.version = None
+        self._cube = None
+        self._lock = threading.Lock()
+
+    def get(self, store):
+        version, typed = store.typed_snapshot()
+        if self._cube is not None and self.version == version:
+            return self._cube
+        with self._lock:
+            if self._cube is None or self.version != version:
+                # One row per student; rows without a valid DATE cannot be placed on the timeline
+                students = deduplicate(typed).dropna(subset=['DATE'])
+                self._cube = StatisticsCube(students)
+                self.version = version
+                logger.info(f"Statistics cube built for roster version {version}: {len(students)} students, "
+                            f"{sum(len(cells) for cells in self._cube.cells.values())} cells")
+            return self._cube
+
+
+@st.cache_resource
+def get_statistics_cube_cache():
+    return StatisticsCubeCache()
@@ -0,0 +1,370 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from roster import (STUDENT_ID_COLUMN, append_student, find_conflicts, find_student_row, format_cell,
+                    get_roster_store, new_student_id, same_value, write_frame_diff)
+from request_scheduler import BACKGROUND, request_lane
+from sheet_diff import FrameDiff
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Pending edits survive restarts in this file
+QUEUE_PATH = os.environ.get('WRITE_QUEUE_PATH', os.path.join('.cache', 'write_queue.sqlite3'))
+
+# How often the background thread sends pending edits to the sheet
+FLUSH_INTERVAL_SECONDS = 1
+
+# Failed flushes are retried with exponential backoff up to this delay
+MAX_RETRY_DELAY_SECONDS = 60
+
+# Edits rejected because someone else changed the same cell are reported for this long
+CONFLICT_REPORT_SECONDS = 600
+
+SCHEMA = [
+    # One pending value per cell: a later edit to the same cell replaces the earlier one.
+    # `base` is the value the first edit started from (NULL: write without checking) and
+    # `session` the browser session of the latest edit, which is told if it is not written.
+    """CREATE TABLE IF NOT EXISTS cells (
+        student_id TEXT NOT NULL, col TEXT NOT NULL, value TEXT NOT NULL, seq INTEGER NOT NULL,
+        base TEXT, session TEXT, PRIMARY KEY (student_id, col))""",
+    # New students, with their Student ID assigned up front
+    """CREATE TABLE IF NOT EXISTS new_rows (
+        student_id TEXT PRIMARY KEY, row_values TEXT NOT NULL, seq INTEGER NOT NULL)""",
+    """CREATE TABLE IF NOT EXISTS deletions (
+        student_id TEXT PRIMARY KEY, seq INTEGER NOT NULL)""",
+    # Edits that were not written; `reason` is 'changed' (someone else changed the cell)
+    # or 'deleted' (the student is no longer in the sheet)
+    """CREATE TABLE IF NOT EXISTS conflicts (
+        student_id TEXT NOT NULL, col TEXT NOT NULL, theirs TEXT NOT NULL, ours TEXT NOT NULL,
+        detected_at REAL NOT NULL, reason TEXT NOT NULL DEFAULT 'changed', student_name TEXT, session TEXT)""",
+]
+
+# Columns added since the first release, created on queues that predate them
+MIGRATIONS = [
+    ('cells', 'base', 'TEXT'),
+    ('conflicts', 'reason', "TEXT NOT NULL DEFAULT 'changed'"),
+    ('conflicts', 'student_name', 'TEXT'),
+    ('cells', 'session', 'TEXT'),
+    ('conflicts', 'session', 'TEXT'),
+]
+
+
+class WriteQueue:
+    """Durable write-behind queue for roster edits, backed by SQLite.
+
+    Edits are accepted immediately: cell changes are applied to the shared
+    roster right away and recorded on disk, where a newer value for the same
+    cell replaces the older one. A background thread sends everything pending
+    to the sheet in one batch, retrying with backoff, and removes only the
+    entries it sent, so edits made during a flush are kept for the next one.
+
+    Writes are optimistic: a cell edit remembers the value it started from,
+    and is only written if the cell still holds that value, both when it is
+    queued and again against the sheet just before the flush. Edits that
+    would overwrite someone else's change are dropped and reported instead.
+    """
+
+    def __init__(self, path=QUEUE_PATH, flush_interval=FLUSH_INTERVAL_SECONDS):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.failures = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._seq = time.time_ns()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            for statement in SCHEMA:
+                conn.execute(statement)
+            for table, column, definition in MIGRATIONS:
+                if column not in [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]:
+                    conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+    @contextmanager
+    def _transaction(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _next_seq(self):
+        # Strictly increasing, also across restarts
+        self._seq = max(self._seq + 1, time.time_ns())
+        return self._seq
+
+    def update_cells(self, student_id, changes, base=None, fingerprint=None):
+        # `base` is the record the edit started from and `fingerprint` the row's fingerprint
+        # at that time. Returns {column: (their value, our value)} for the changes that
+        # were not queued because someone else changed those cells in the meantime.
+        if not changes:
+            return {}
+        store = get_roster_store()
+        conflicts = {}
+        if base is not None and (fingerprint is None or fingerprint != store.fingerprint(student_id)):
+            conflicts = find_conflicts(store.row_record(student_id) or {}, base, changes)
+        changes = {col: value for col, value in changes.items() if col not in conflicts}
+        if changes:
+            store.apply_local_update(find_student_row(student_id), changes)
+            bases = None if base is None else {student_id: {col: base.get(col) for col in changes}}
+            self._enqueue_cells({student_id: changes}, bases)
+        return conflicts
+
+    def _enqueue_cells(self, changes_by_student, bases_by_student=None):
+        session = current_session_id()
+        with self._lock, self._transaction() as conn:
+            for student_id, changes in changes_by_student.items():
+                pending = conn.execute('SELECT row_values FROM new_rows WHERE student_id = ?', (student_id,)).fetchone()
+                if pending:
+                    # Not in the sheet yet: fold the edit into the queued row
+                    values = dict(json.loads(pending[0]), **changes)
+                    conn.execute('UPDATE new_rows SET row_values = ?, seq = ? WHERE student_id = ?',
+                                 (json.dumps(values), self._next_seq(), student_id))
+                    continue
+                # A cell edited again keeps the base of its first pending edit
+                bases = (bases_by_student or {}).get(student_id)
+                conn.executemany(
+                    'INSERT INTO cells (student_id, col, value, seq, session, base) VALUES (?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (student_id, col) DO UPDATE SET value = excluded.value, seq = excluded.seq, '
+                    'session = excluded.session',
+                    [(student_id, col, '' if value is None else str(value), self._next_seq(), session,
+                      None if bases is None else format_cell(col, bases.get(col)))
+                     for col, value in changes.items()])
+        self._wake.set()
+
+    def append_row(self, values):
+        # Queue a new student; returns the Student ID the row will have
+        student_id = values.get(STUDENT_ID_COLUMN) or new_student_id()
+        values = dict(values, **{STUDENT_ID_COLUMN: student_id})
+        with self._lock, self._transaction() as conn:
+            conn.execute('INSERT INTO new_rows (student_id, row_values, seq) VALUES (?, ?, ?)',
+                         (student_id, json.dumps(values), self._next_seq()))
+        self._wake.set()
+        return student_id
+
+    def delete_rows(self, student_ids):
+        with self._lock, self._transaction() as conn:
+            for student_id in student_ids:
+                conn.execute('DELETE FROM cells WHERE student_id = ?', (student_id,))
+                if conn.execute('DELETE FROM new_rows WHERE student_id = ?', (student_id,)).rowcount:
+                    continue
+                conn.execute('INSERT OR REPLACE INTO deletions (student_id, seq) VALUES (?, ?)',
+                             (student_id, self._next_seq()))
+        self._wake.set()
+
+    def enqueue_diff(self, diff):
+        # A FrameDiff keyed by Student ID, as produced from the GoogleSheet editor.
+        # Returns {(student ID, column): (their value, our value)} for cells not queued.
+        changes_by_student = {}
+        bases_by_student = {}
+        for (student_id, col), value in diff.cells.items():
+            changes_by_student.setdefault(student_id, {})[col] = value
+            bases_by_student.setdefault(student_id, {})[col] = diff.base.get((student_id, col))
+
+        store = get_roster_store()
+        conflicts = {}
+        for student_id, changes in list(changes_by_student.items()):
+            found = find_conflicts(store.row_record(student_id) or {}, bases_by_student[student_id], changes)
+            for col, values in found.items():
+                conflicts[(student_id, col)] = values
+                del changes[col]
+            if not changes:
+                del changes_by_student[student_id]
+        if changes_by_student:
+            store.apply_local_updates({find_student_row(student_id): changes
+                                       for student_id, changes in changes_by_student.items()})
+            self._enqueue_cells(changes_by_student, bases_by_student)
+        for values in diff.appended:
+            self.append_row(values)
+        if diff.deleted:
+            self.delete_rows(diff.deleted)
+        return conflicts
+
+    def pending_count(self):
+        with self._transaction() as conn:
+            return sum(conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                       for table in ('cells', 'new_rows', 'deletions'))
+
+    def _pending(self):
+        with self._transaction() as conn:
+            cells = conn.execute('SELECT student_id, col, value, base, session, seq FROM cells').fetchall()
+            new_rows = conn.execute('SELECT student_id, row_values, seq FROM new_rows ORDER BY seq').fetchall()
+            deletions = conn.execute('SELECT student_id, seq FROM deletions').fetchall()
+        return cells, new_rows, deletions
+
+    def _forget(self, table, keys, entries):
+        # Remove sent entries unless they were edited again while the flush was running
+        where = ' AND '.join(f'{key} = ?' for key in keys)
+        with self._lock, self._transaction() as conn:
+            conn.executemany(f'DELETE FROM {table} WHERE {where} AND seq = ?', entries)
+
+    def _requeue_as_cells(self, student_id, values, seq):
+        with self._lock, self._transaction() as conn:
+            conn.execute('DELETE FROM new_rows WHERE student_id = ? AND seq = ?', (student_id, seq))
+            conn.executemany(
+                'INSERT OR IGNORE INTO cells (student_id, col, value, seq) VALUES (?, ?, ?, ?)',
+                [(student_id, col, '' if value is None else str(value), self._next_seq())
+                 for col, value in values.items() if col != STUDENT_ID_COLUMN])
+
+    def flush(self):
+        # Send everything pending; returns the number of entries written
+        with self._flush_lock:
+            cells, new_rows, deletions = self._pending()
+            if not (cells or new_rows or deletions):
+                return 0
+            store = get_roster_store()
+            names = {sid: (store.row_record(sid) or {}).get('Student Name', sid) for sid, _, _, _, _, _ in cells}
+            cells = self._check_against_sheet(store, cells, names)
+
+            # Edits to students that are no longer in the sheet cannot be applied; they are
+            # reported like conflicts. Deleting a student who is already gone needs nothing.
+            missing = [entry for entry in cells if store.position_of(entry[0]) is None]
+            if missing:
+                self._record_conflicts([(sid, col, '', value, 'deleted', names[sid], session)
+                                        for sid, col, value, _, session, _ in missing])
+                self._forget('cells', ['student_id', 'col'], [(sid, col, seq) for sid, col, _, _, _, seq in missing])
+            self._forget('deletions', ['student_id'], [entry for entry in deletions if store.position_of(entry[0]) is None])
+            cells = [entry for entry in cells if store.position_of(entry[0]) is not None]
+            deletions = [entry for entry in deletions if store.position_of(entry[0]) is not None]
+
+            if cells or deletions:
+                write_frame_diff(FrameDiff(cells={(sid, col): value for sid, col, value, _, _, _ in cells},
+                                           deleted=[sid for sid, _ in deletions]))
+                self._forget('cells', ['student_id', 'col'], [(sid, col, seq) for sid, col, _, _, _, seq in cells])
+                self._forget('deletions', ['student_id'], deletions)
+            for student_id, row_values, seq in new_rows:
+                values = json.loads(row_values)
+                if store.position_of(student_id) is None:
+                    append_student(values)
+                    self._forget('new_rows', ['student_id'], [(student_id, seq)])
+                else:
+                    # Already appended by an earlier flush that was interrupted or
+                    # edited meanwhile: send its values as cell edits instead
+                    self._requeue_as_cells(student_id, values, seq)
+
+            written = len(cells) + len(new_rows) + len(deletions)
+            logger.info(f"Write queue flushed: {len(cells)} cells, {len(new_rows)} new rows, {len(deletions)} deletions")
+            return written
+
+    def _check_against_sheet(self, store, cells, names):
+        # Re-read the rows of checked edits from the sheet, then keep only the edits whose
+        # cell still holds their base value; cells that already hold our value are done.
+        # Edits of students no longer in the sheet are kept for the caller to report.
+        checked = [entry for entry in cells if entry[3] is not None]
+        if not checked:
+            return cells
+        store.refresh_students(sorted({sid for sid, _, _, _, _, _ in checked}))
+        keep, done, conflicts = [], [], []
+        for entry in cells:
+            sid, col, value, base, session, seq = entry
+            record = store.row_record(sid)
+            if base is None or record is None or same_value(col, record.get(col, ''), base):
+                keep.append(entry)
+                continue
+            theirs = record.get(col, '')
+            done.append((sid, col, seq))
+            if not same_value(col, theirs, value):
+                conflicts.append((sid, col, theirs, value, 'changed', names[sid], session))
+        if conflicts:
+            self._record_conflicts(conflicts)
+        self._forget('cells', ['student_id', 'col'], done)
+        return keep
+
+    def _record_conflicts(self, conflicts):
+        # conflicts: [(student ID, column, their value, our value, reason, student name, session)]
+        now = time.time()
+        with self._lock, self._transaction() as conn:
+            conn.executemany('INSERT INTO conflicts (student_id, col, theirs, ours, reason, student_name, session, '
+                             'detected_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', [entry + (now,) for entry in conflicts])
+        logger.warning(f"Write queue: {len(conflicts)} edits not written: " +
+                       ", ".join(f"{col} of {sid} ({reason})" for sid, col, _, _, reason, _, _ in conflicts))
+
+    def recent_conflicts(self, session, within=CONFLICT_REPORT_SECONDS):
+        # [(student name, column, their value, our value, reason)] of edits made by `session`
+        # that were rejected at flush time recently
+        cutoff = time.time() - within
+        with self._lock, self._transaction() as conn:
+            conn.execute('DELETE FROM conflicts WHERE detected_at < ?', (cutoff,))
+            return conn.execute('SELECT COALESCE(student_name, student_id), col, theirs, ours, reason FROM conflicts '
+                                'WHERE session = ? ORDER BY detected_at', (session,)).fetchall()
+
+    def reapply_pending(self):
+        # After a restart, show queued cell edits until they reach the sheet
+        cells, _, _ = self._pending()
+        store = get_roster_store()
+        updates = {}
+        for student_id, col, value, _, _, _ in cells:
+            position = store.position_of(student_id)
+            if position is not None:
+                updates.setdefault(position, {})[col] = value
+        store.apply_local_updates(updates)
+
+    def run(self):
+        with request_lane(BACKGROUND):
+            # Queued edits are reapplied on top of a synced roster, or the sync would undo them.
+            # Waiting for it here keeps a cold start on the snapshot instead of on the sheet.
+            try:
+                get_roster_store().get(wait=True)
+                self.reapply_pending()
+            except Exception as e:
+                logger.error(f"Could not reapply queued edits: {str(e)}")
+            self._flush_loop()
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+                self.failures = 0
+                self.last_error = None
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                delay = min(MAX_RETRY_DELAY_SECONDS, 2 ** self.failures)
+                logger.error(f"Write queue flush failed (attempt {self.failures}), retrying in {delay}s: {str(e)}")
+                time.sleep(delay)
+
+    def start(self):
+        threading.Thread(target=self.run, name="write-queue", daemon=True).start()
+        return self
+
+
+# Function to identify the browser session making an edit; None outside a Streamlit script run
+def current_session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
+
+
+# One queue and flush thread per server process
+@st.cache_resource
+def get_write_queue():
+    return WriteQueue().start()
+
+
+# Function to tell the agent about edits that have not reached the sheet yet
+def show_sync_status():
+    queue = get_write_queue()
+    pending = queue.pending_count()
+    for student_name, col, theirs, ours, reason in queue.recent_conflicts(current_session_id()):
+        if reason == 'deleted':
+            st.sidebar.warning(f"Not saved: {student_name} is no longer in the sheet, so your value "
+                               f"'{ours}' for {col} was not written.")
+        else:
+            st.sidebar.warning(f"Not saved: {col} of {student_name} was changed to "
+                               f"'{theirs}' by someone else, so your value '{ours}' was not written.")
+    if pending and queue.last_error:
+        st.sidebar.warning(f"{pending} edits waiting to sync to Google Sheets, retrying: {queue.last_error}")
+    elif pending:
+        st.sidebar.caption(f"Syncing {pending} edits to Google Sheets…")